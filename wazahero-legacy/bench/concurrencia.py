@@ -0,0 +1,83 @@
+"""
+Validación de ControlConcurrencia contra el stand-in de Drive.
+
+Descarga el mismo lote con el control adaptativo y con un pool fijo de 4
+(el comportamiento anterior), en un enlace libre y en uno que responde 429
+por encima de 5 conexiones. Muestra el tiempo, los errores, los 429 y cómo
+evolucionó el límite de descargas simultáneas.
+
+Uso, desde la raíz del repo:  python -m bench.concurrencia
+"""
+import os
+import sys
+import time
+import hashlib
+import threading
+
+from bench.drive_standin import Moldeador, DriveStandIn, carpeta_temporal, borrar_carpeta
+
+ARCHIVOS = 120
+TAMANO = 300_000
+MUESTREO = 0.5 # Segundos entre muestras del límite
+
+ESCENARIOS = [
+    ("enlace libre", dict(total_bps=4_000_000, por_conexion_bps=600_000)),
+    ("429 sobre 5 conexiones", dict(total_bps=4_000_000, por_conexion_bps=600_000, max_conexiones=5)),
+]
+CONTROLES = [
+    ("adaptativo", dict(minimo=1, maximo=16, inicial=2, ventana=0.5)),
+    ("fijo 4", dict(minimo=4, maximo=4, inicial=4)),
+]
+
+
+def medir(motor, control, archivos):
+    muestras = []
+    fin = threading.Event()
+
+    def muestrear():
+        while not fin.wait(MUESTREO):
+            muestras.append(control.limite)
+
+    threading.Thread(target=muestrear, daemon=True).start()
+    inicio = time.monotonic()
+    errores = sum(1 for _, error in motor.descargar(archivos) if error)
+    fin.set()
+    return time.monotonic() - inicio, errores, muestras
+
+
+def main():
+    standin = DriveStandIn(Moldeador(**ESCENARIOS[0][1])).iniciar()
+    carpeta = carpeta_temporal()
+    try:
+        from src.core.download_engine import ControlConcurrencia, MotorDescargas
+        from src.core.drive_logic import DriveManager
+
+        datos = {f"f{i}": os.urandom(TAMANO) for i in range(ARCHIVOS)}
+        for file_id, contenido in datos.items():
+            standin.agregar(file_id, contenido)
+        logic = DriveManager()
+
+        fallidos = 0
+        print(f"{ARCHIVOS} archivos de {TAMANO // 1000} KB")
+        for nombre_escenario, enlace in ESCENARIOS:
+            for nombre_control, parametros in CONTROLES:
+                standin.moldeador = Moldeador(**enlace)
+                destino = os.path.join(carpeta, f"{nombre_escenario}-{nombre_control}".replace(' ', '_'))
+                archivos = [
+                    {'nombre': file_id, 'id_drive': file_id, 'ruta_final': os.path.join(destino, file_id),
+                     'hash': hashlib.md5(contenido).hexdigest(), 'tamano': str(len(contenido))}
+                    for file_id, contenido in datos.items()
+                ]
+                control = ControlConcurrencia(**parametros)
+                segundos, errores, muestras = medir(MotorDescargas(logic, control), control, archivos)
+                fallidos += errores
+                print(f"{nombre_escenario:24s} {nombre_control:11s} {segundos:6.1f} s  errores={errores} "
+                      f"429={standin.moldeador.respuestas_429:3d}  límite={muestras}")
+        return 1 if fallidos else 0
+    finally:
+        standin.detener()
+        borrar_carpeta(carpeta)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import os
+import time
+import shutil
+import tempfile
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Servidor local que imita la descarga de medios de Drive v3
+# (GET /drive/v3/files/<id>?alt=media con Range) para medir el motor de
+# descargas sin red ni credenciales. Los benchmarks de bench/ lo levantan y
+# apuntan el launcher a él con DRIVE_API_ENDPOINT (ver drive_service.py).
+BLOQUE_ENVIO = 16 * 1024
+
+
+class Moldeador:
+    """
+    Condiciones del enlace simulado.
+
+    - total_bps: ancho de banda compartido por todas las conexiones (token bucket).
+    - por_conexion_bps: tope de cada conexión (None = solo el total).
+    - max_conexiones: por encima de esta cantidad de pedidos simultáneos se
+      responde 429, como cuando Drive limita (None = nunca).
+    - latencia: segundos de espera antes de responder cada pedido (ida y vuelta).
+    """
+
+    def __init__(self, total_bps, por_conexion_bps=None, max_conexiones=None, latencia=0.0):
+        self.total_bps = total_bps
+        self.por_conexion_bps = por_conexion_bps
+        self.max_conexiones = max_conexiones
+        self.latencia = latencia
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._ultimo = time.monotonic()
+        self.activas = 0
+        self.pedidos = 0
+        self.respuestas_429 = 0
+        self.bytes_enviados = 0
+
+    def reiniciar_contadores(self):
+        with self._lock:
+            self.pedidos = 0
+            self.respuestas_429 = 0
+            self.bytes_enviados = 0
+
+    def entrar(self):
+        """Registra un pedido; retorna False si hay que responder 429."""
+        with self._lock:
+            self.pedidos += 1
+            if self.max_conexiones and self.activas >= self.max_conexiones:
+                self.respuestas_429 += 1
+                return False
+            self.activas += 1
+            return True
+
+    def salir(self):
+        with self._lock:
+            self.activas -= 1
+
+    def tomar(self, n):
+        """Espera hasta que el ancho de banda total permita enviar n bytes."""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.total_bps * 0.1, self._tokens + (ahora - self._ultimo) * self.total_bps)
+                self._ultimo = ahora
+                if self._tokens >= n:
+                    self._tokens -= n
+                    self.bytes_enviados += n
+                    return
+            time.sleep(0.005)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _vacio(self, estado, cabeceras=()):
+        self.send_response(estado)
+        for nombre, valor in cabeceras:
+            self.send_header(nombre, valor)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        standin = self.server.standin
+        url = urllib.parse.urlparse(self.path)
+        consulta = dict(urllib.parse.parse_qsl(url.query))
+        datos = standin.archivos.get(url.path.rsplit('/', 1)[-1])
+        if consulta.get('alt') != 'media' or datos is None:
+            return self._vacio(404)
+
+        moldeador = standin.moldeador
+        if moldeador.latencia:
+            time.sleep(moldeador.latencia)
+        if not moldeador.entrar():
+            return self._vacio(429)
+        try:
+            rango = self.headers.get('range')
+            if rango:
+                desde, hasta = rango.split('=', 1)[1].split('-')
+                desde = int(desde)
+                hasta = min(int(hasta) if hasta else len(datos) - 1, len(datos) - 1)
+                if desde >= len(datos):
+                    return self._vacio(416, [('Content-Range', f'bytes */{len(datos)}')])
+                cuerpo = datos[desde:hasta + 1]
+                self.send_response(206)
+                self.send_header('Content-Range', f'bytes {desde}-{hasta}/{len(datos)}')
+            else:
+                cuerpo = datos
+                self.send_response(200)
+            self.send_header('Content-Length', str(len(cuerpo)))
+            self.end_headers()
+
+            inicio = time.monotonic()
+            for i in range(0, len(cuerpo), BLOQUE_ENVIO):
+                bloque = cuerpo[i:i + BLOQUE_ENVIO]
+                moldeador.tomar(len(bloque))
+                self.wfile.write(bloque)
+                if moldeador.por_conexion_bps:
+                    atraso = (i + len(bloque)) / moldeador.por_conexion_bps - (time.monotonic() - inicio)
+                    if atraso > 0:
+                        time.sleep(atraso)
+        finally:
+            moldeador.salir()
+
+
+class DriveStandIn:
+    """
+    Servidor en 127.0.0.1 con un puerto libre. archivos: {id_drive: bytes}.
+    iniciar() lo levanta en un hilo y exporta DRIVE_API_ENDPOINT; hay que
+    llamarlo antes de importar src.core (drive_service lee la variable al importarse).
+    """
+
+    def __init__(self, moldeador):
+        self.moldeador = moldeador
+        self.archivos = {}
+        self._servidor = None
+
+    def agregar(self, file_id, datos):
+        self.archivos[file_id] = datos
+
+    def iniciar(self):
+        self._servidor = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._servidor.daemon_threads = True
+        self._servidor.standin = self
+        threading.Thread(target=self._servidor.serve_forever, name="drive-standin", daemon=True).start()
+        os.environ['DRIVE_API_ENDPOINT'] = f"http://127.0.0.1:{self._servidor.server_port}"
+        return self
+
+    def detener(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+
+def carpeta_temporal():
+    """
+    Crea una carpeta de trabajo y se mueve a ella: data/ y config/ del launcher
+    se resuelven con os.getcwd() al importar drive_logic, así no se toca el repo.
+    """
+    carpeta = tempfile.mkdtemp(prefix='wazahero-bench-')
+    os.chdir(carpeta)
+    return carpeta
+
+
+def borrar_carpeta(carpeta):
+    os.chdir(tempfile.gettempdir())
+    shutil.rmtree(carpeta, ignore_errors=True)
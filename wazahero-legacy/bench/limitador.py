@@ -0,0 +1,70 @@
+"""
+Comprobación de LimitadorBanda contra el stand-in de Drive.
+
+Con 'limite_descarga_kb_s' en launcher_config.json, varias descargas
+simultáneas comparten un solo tope: la tasa total medida tiene que quedar a
+pocos por ciento del límite. También verifica que un tramo de
+'limite_descarga_horario' con kb_s 0 que cubre la hora actual lo libere.
+
+Uso, desde la raíz del repo:  python -m bench.limitador [kb_s] [hilos]
+"""
+import os
+import sys
+import time
+import hashlib
+import datetime
+
+from bench.drive_standin import Moldeador, DriveStandIn, carpeta_temporal, borrar_carpeta
+
+LIMITE_KB_S = 500
+HILOS = 6
+TOLERANCIA = 0.05     # Desvío máximo aceptado respecto del tope
+SEGUNDOS_OBJETIVO = 20 # Duración aproximada de la descarga con el tope activo
+TAMANOS = (1_500_000, 200_000, 20_000) # Mezcla de audio, arte e ini/chart
+
+
+def main(limite_kb_s=LIMITE_KB_S, hilos=HILOS):
+    # El enlace simulado es mucho más rápido que el tope: lo que se mide es el limitador
+    standin = DriveStandIn(Moldeador(total_bps=100_000_000, por_conexion_bps=30_000_000)).iniciar()
+    carpeta = carpeta_temporal()
+    try:
+        from src.core.download_engine import ControlConcurrencia, MotorDescargas
+        from src.core.drive_logic import DriveManager
+
+        logic = DriveManager()
+        logic.guardar_config('limite_descarga_kb_s', limite_kb_s)
+        logic.guardar_config('limite_descarga_horario', [])
+        tope = limite_kb_s * 1024
+
+        archivos = []
+        total = 0
+        while total < tope * SEGUNDOS_OBJETIVO:
+            n = len(archivos)
+            contenido = os.urandom(TAMANOS[n % len(TAMANOS)])
+            standin.agregar(f"f{n}", contenido)
+            archivos.append({'nombre': f"f{n}", 'id_drive': f"f{n}", 'ruta_final': os.path.join(carpeta, 'Songs', f"s{n}", 'f'),
+                             'hash': hashlib.md5(contenido).hexdigest(), 'tamano': str(len(contenido))})
+            total += len(contenido)
+
+        motor = MotorDescargas(logic, ControlConcurrencia(minimo=hilos, maximo=hilos, inicial=hilos))
+        inicio = time.monotonic()
+        errores = [error for _, error in motor.descargar(archivos) if error]
+        segundos = time.monotonic() - inicio
+        tasa = total / segundos
+        desvio = tasa / tope - 1
+        print(f"{len(archivos)} archivos, {total / 1e6:.1f} MB, {hilos} hilos: {tasa / 1024:.0f} KB/s "
+              f"con tope {limite_kb_s} KB/s ({desvio:+.1%}), {segundos:.1f} s, errores={len(errores)}")
+
+        hora = datetime.datetime.now().hour
+        logic.guardar_config('limite_descarga_horario', [{'desde': f"{hora:02d}:00", 'hasta': f"{(hora + 1) % 24:02d}:00", 'kb_s': 0}])
+        libre = logic.limitador_banda().tasa_actual() is None
+        print(f"Horario con kb_s 0 en la hora actual: {'sin límite' if libre else 'SIGUE LIMITADO'}")
+
+        return 0 if not errores and abs(desvio) <= TOLERANCIA and libre else 1
+    finally:
+        standin.detener()
+        borrar_carpeta(carpeta)
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(int(a) for a in sys.argv[1:3])))
@@ -0,0 +1,61 @@
+"""
+Benchmark de TramoAdaptativo contra el stand-in de Drive.
+
+Descarga los mismos archivos con tramos fijos (1 MB como sync_launcher antes,
+5 MB como descargar_archivo antes) y con tramos adaptativos, en un enlace con
+latencia por pedido. Cuenta los pedidos Range que llegan al servidor y la
+tasa sostenida: un lote de archivos de una canción (chart, ini, arte, audio)
+y un video grande.
+
+Uso, desde la raíz del repo:  python -m bench.tramos
+"""
+import os
+import sys
+import time
+import hashlib
+
+from bench.drive_standin import Moldeador, DriveStandIn, carpeta_temporal, borrar_carpeta
+
+LATENCIA = 0.1 # Segundos por pedido (ida y vuelta)
+LOTES = {
+    'cancion': (3_000, 150_000, 900_000, 2_500_000, 7_000_000),
+    'video': (120_000_000,),
+}
+
+
+def main():
+    standin = DriveStandIn(Moldeador(total_bps=40_000_000, por_conexion_bps=15_000_000, latencia=LATENCIA)).iniciar()
+    carpeta = carpeta_temporal()
+    try:
+        from src.core import transfer
+        from src.core.drive_logic import DriveManager
+
+        service = DriveManager().obtener_servicio()
+        datos = {}
+        for lote, tamanos in LOTES.items():
+            datos[lote] = [(f"{lote}{i}", os.urandom(t)) for i, t in enumerate(tamanos)]
+            for file_id, contenido in datos[lote]:
+                standin.agregar(file_id, contenido)
+
+        modos = [("fijo 1 MB", 1024 * 1024), ("fijo 5 MB", transfer.CHUNK_DESCARGA), ("adaptativo", None)]
+        print(f"Latencia {LATENCIA * 1000:.0f} ms por pedido, 15 MB/s por conexión")
+        for nombre, chunksize in modos:
+            for lote, archivos in datos.items():
+                standin.moldeador.reiniciar_contadores()
+                inicio = time.monotonic()
+                for file_id, contenido in archivos:
+                    transfer.descargar_reanudable(
+                        service, file_id, os.path.join(carpeta, nombre.replace(' ', '_'), file_id),
+                        hashlib.md5(contenido).hexdigest(), chunksize=chunksize, tamano_esperado=len(contenido))
+                segundos = time.monotonic() - inicio
+                total = sum(len(c) for _, c in archivos)
+                print(f"{nombre:11s} {lote:8s} pedidos={standin.moldeador.pedidos:4d}  "
+                      f"{segundos:6.2f} s  {total / segundos / 1e6:5.1f} MB/s")
+        return 0
+    finally:
+        standin.detener()
+        borrar_carpeta(carpeta)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
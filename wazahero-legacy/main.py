@@ -4,17 +4,26 @@ import time
 import threading
 import json
 import ctypes
-import concurrent.futures
+import multiprocessing
 from PyQt6.QtWidgets import (QApplication, QFileDialog) 
 from PyQt6.QtGui import QIcon
 from src.ui.main_window import LauncherWindow, QColor, VERSION
-from src.core.drive_logic import DriveManager
+from src.core.drive_logic import DriveManager, cola_descargas
+from src.core.stat_index import StatIndex
+from src.core.download_engine import formato_bytes, formato_eta
 
 COLOR_ACENTO = "#0AC8B9" 
 COLOR_EXITO = "#30D158"
 
 CACHED_LIBRARY_FILE = 'data/library_cache.json'
 
+# Streaming of scan results into the selection table
+SCAN_BATCH_SIZE = 25
+SCAN_BATCH_SECONDS = 0.3
+
+class ScanCancelled(Exception):
+    """The user left the selection page while the scan was still running."""
+
 class Controller:
     def __init__(self):
         # Fix taskbar icon on Windows
@@ -49,9 +58,15 @@ class Controller:
         self.gui.sig_cancel_selection.connect(self.cancel_selection)
         self.gui.sig_open_library.connect(self.open_local_library)
         self.gui.sig_go_home.connect(self.handle_go_home)
+        self.gui.sig_resume_download.connect(self.handle_resume_download)
         
         self.pending_results = False # track if  pending songs to sync
         self.stop_requested = False 
+        self.motor_descargas = None
+        self.downloading = False # Set on the GUI thread before the worker starts, cleared when it ends
+        self.scanning = False # Only one scan at a time (master, snapshot and hash store are shared)
+        self.scan_cancel = threading.Event()
+        self.resume_offered = False # The persisted queue is offered once per session
         
         # Mostrar ventana
         self.gui.show()
@@ -89,9 +104,47 @@ class Controller:
         else: 
             self.gui.set_status("CONFIGURACIÓN PENDIENTE", "Falta seleccionar la carpeta Songs o el Juego.", COLOR_ACENTO)
 
-        # Check for updates in background
+        # Recover downloads interrupted by a crash, then check for updates (background)
+        threading.Thread(target=self.recover_downloads, daemon=True).start()
         threading.Thread(target=self.check_for_updates, daemon=True).start()
 
+    def recover_downloads(self):
+        try:
+            instalados, reanudables = self.logic.recuperar_descargas()
+            if instalados or reanudables:
+                self.gui.log(f"Recuperación: {instalados} archivos completados, {reanudables} descargas listas para reanudar.")
+        except Exception as e:
+            self.gui.log(f"[WAR] No se pudo revisar el journal de descargas: {e}")
+
+        # Selection left over from a previous session (closed, crashed or stopped)
+        if self.resume_offered:
+            return
+        self.resume_offered = True
+        try:
+            resumen = cola_descargas().resumen()
+            if resumen['pendiente'] or resumen['fallido']:
+                self.gui.offer_resume(resumen['pendiente'], resumen['fallido'])
+        except Exception as e:
+            self.gui.log(f"[WAR] No se pudo leer la cola de descargas: {e}")
+
+    def handle_resume_download(self, mode):
+        cola = cola_descargas()
+        if self.downloading:
+            self.gui.log("! Ya hay una descarga en curso.")
+            return
+        if self.scanning and mode != "discard":
+            self.gui.log("! Hay un escaneo en curso; la cola guardada se puede reanudar al terminar.")
+            return
+        if mode == "discard":
+            cola.vaciar()
+            self.gui.log("Cola de descargas descartada.")
+            return
+        archivos = cola.reintentar_fallidos() if mode == "failed" else cola.pendientes()
+        if archivos:
+            self.gui.log(f"Reanudando {len(archivos)} archivos de la cola guardada (sin escanear).")
+            # start_download leaves the card in DOWNLOADING: it leads to the progress page and DETENER
+            self.start_download(archivos, encolar=False)
+
     def check_for_updates(self):
         try:
             service = self.logic.obtener_servicio()
@@ -103,18 +156,36 @@ class Controller:
         except: pass # Don't crash if check fails
 
     def handle_sync(self):
-        if self.gui._sync_card_mode == "DOWNLOADING":
+        if self.downloading or self.gui._sync_card_mode == "DOWNLOADING":
             self.gui.log("! Sincronización ignorada: Descarga en curso.")
             return
+        if self.scanning:
+            self.gui.log("! Ya hay un escaneo en curso.")
+            return
         rs = self.logic.obtener_config('ruta_songs')
         if not rs:
             self.gui.log("! Primero configura la carpeta Songs.")
             return
+        self.scanning = True
+        self.scan_cancel.clear()
         self.gui.set_sync_enabled(False)
         self.gui.set_status("ESCANEANDO...", "Analizando diferencias...", COLOR_ACENTO)
         threading.Thread(target=self.scan_worker, args=(rs,), daemon=True).start()
 
     def scan_worker(self, rs):
+        try:
+            self._scan(rs)
+        except ScanCancelled:
+            self.pending_results = False # Partial results are discarded with the page
+            self.gui.log("! Escaneo cancelado.")
+            self.gui.set_status("CANCELADO", "Sincronización cancelada por usuario.", COLOR_ACENTO)
+        finally:
+            self.scanning = False
+            if self.scan_cancel.is_set():
+                self.gui.set_selection_scanning(False)
+                self.gui.set_sync_enabled(True)
+
+    def _scan(self, rs):
         try:
             service = self.logic.obtener_servicio()
             
@@ -130,123 +201,116 @@ class Controller:
                 self.gui.log("! Usando lista local (si existe).")
 
             # --- PASO 2: Cargar lista ---
-            if not os.path.exists("data/master_songs.json"):
+            if not self.logic.ruta_manifiesto():
                 self.gui.log("ERR: No hay lista de canciones.")
                 self.gui.set_status("ERROR DE LISTA", "No se encontró master_songs.json", COLOR_ACENTO)
                 self.gui.set_sync_enabled(True)
                 return
 
-            with open("data/master_songs.json", "r", encoding="utf-8") as f:
-                servidor = json.load(f)["archivos"]
+            # Índice compacto en columnas (se reutiliza si el archivo no cambió)
+            servidor = self.logic.cargar_manifiesto()
             
             # --- PASO 3: Identificar archivos a descargar (Turbo Mode) ---
-            descargas_pendientes = {}
             self.gui.log(f"Verificando {len(servidor)} archivos...")
             self.gui.set_status("VERIFICANDO", f"Analizando {len(servidor)} archivos...")
             
-            local_cache = self.logic.load_cache()
-            cache_updated = False
-            total_archivos = len(servidor)
-            start_time = time.time()
-            
-            for idx, item in enumerate(servidor):
-                # Update status
-                if idx % 50 == 0:
-                   porcentaje = int((idx / total_archivos) * 100)
-                   self.gui.set_status("VERIFICANDO", f"{porcentaje}% completado...")
-                   self.gui.set_progress((idx + 1) / total_archivos)
-
-                ruta_relativa = item['ruta_relativa'].replace('\\', '/')
-                ruta_final = os.path.join(rs, ruta_relativa, item['nombre'])
-                
-                descargar = False
-                
-                # Check Local Existence
-                item['local_exists'] = os.path.exists(ruta_final) # Flag for UI
-                
-                if not item['local_exists']:
-                    descargar = True
+            local_cache = self.logic.load_cache(rs)
+            stat_index = StatIndex(rs) # Un scandir por carpeta, compartido con el chequeo NUEVA/UPDATE
+
+            def progreso(idx, total_archivos):
+                # Called between blocks: lets a cancel stop the scan even when no song is pending
+                if self.scan_cancel.is_set():
+                    raise ScanCancelled()
+                porcentaje = int((idx / total_archivos) * 100)
+                self.gui.set_status("VERIFICANDO", f"{porcentaje}% completado...")
+                self.gui.set_progress(idx / total_archivos)
+                # A batch waiting for a next pending song is flushed between blocks too
+                if lote and time.time() - ultimo_envio >= SCAN_BATCH_SECONDS:
+                    enviar_lote()
+
+            # Las canciones pendientes llegan a la tabla en lotes mientras el escaneo sigue
+            # (hashes faltantes en paralelo, hash_workers en launcher_config.json)
+            count_songs = 0
+            count_files = 0
+            lote = []
+            ultimo_envio = time.time()
+            tabla_visible = False
+
+            def enviar_lote():
+                nonlocal lote, ultimo_envio, tabla_visible
+                if not tabla_visible:
+                    # TRIGGER SELECTION UI (Main Thread) with the first results
+                    self.gui.set_status("NUEVOS CHART DETECTADOS", "Buscando más canciones...", COLOR_ACENTO)
+                    self.pending_results = True # Mark as results pending
+                    self.gui.show_selection(lote)
+                    self.gui.set_selection_scanning(True)
+                    tabla_visible = True
                 else:
-                    size_local = os.path.getsize(ruta_final)
-                    size_remoto = int(item.get('tamano', 0))
-                    
-                    if size_local != size_remoto:
-                         self.gui.log(f"CAMBIO TAMAÑO: {item['nombre']}")
-                         descargar = True
-                    else:
-                        md5_local = self.logic.get_file_hash(ruta_final, cache=local_cache)
-                        cache_updated = True
-                        md5_remoto = item.get('hash')
-                        if md5_remoto and md5_local != md5_remoto:
-                            descargar = True
-                
-                if descargar:
-                    # Enriched item for download
-                    item['ruta_final'] = ruta_final 
-                    # Ensure id_drive is present
-                    if 'id_drive' not in item:
-                         item['id_drive'] = item.get('id')
-                    
-                    # GROUPING LOGIC
-                    # Usamos ruta_relativa como identificador de la canción
-                    group_key = item['ruta_relativa']
-                    if group_key not in descargas_pendientes:
-                        descargas_pendientes[group_key] = []
-                    descargas_pendientes[group_key].append(item)
-            
-            if cache_updated:
+                    self.gui.append_selection(lote)
+                lote = []
+                ultimo_envio = time.time()
+
+            pendientes = self.logic.iterar_pendientes(
+                servidor, rs, cache=local_cache,
+                log_callback=self.gui.log, progress_callback=progreso, stat_index=stat_index)
+            try:
+                for group_key, files in pendientes:
+                    if self.scan_cancel.is_set():
+                        raise ScanCancelled()
+                    count_songs += 1
+                    count_files += len(files)
+                    lote.extend(self.logic.armar_lista_ui({group_key: files}, rs, stat_index=stat_index))
+
+                    # The first pending song is shown at once; the rest are batched
+                    if not tabla_visible or len(lote) >= SCAN_BATCH_SIZE or time.time() - ultimo_envio >= SCAN_BATCH_SECONDS:
+                        enviar_lote()
+            except ScanCancelled:
+                # Closing the generator stops the hash workers and saves the snapshot as incomplete;
+                # the hash cache is kept without pruning (most entries were never visited)
+                pendientes.close()
                 self.logic.save_cache(local_cache)
+                raise
+
+            self.logic.save_cache(local_cache, prune=True)
+            if self.scan_cancel.is_set():
+                raise ScanCancelled() # Finished right after the user cancelled: keep the page closed
 
             # --- PASO 4: Decisión ---
             self.gui.set_progress(1)
             
-            if not descargas_pendientes:
+            if not count_songs:
                 self.gui.log("✓ Todo al día.")
                 self.gui.set_status("SISTEMA SINCRONIZADO", "Tu colección está al día. ¡A jugar!", COLOR_EXITO)
                 self.gui.set_sync_enabled(True)
             else:
-                count_songs = len(descargas_pendientes)
-                # Count total files for log
-                count_files = sum(len(v) for v in descargas_pendientes.values())
-                
                 self.gui.log(f"Se encontraron {count_songs} canciones ({count_files} archivos) para actualizar.")
                 
-                # Convert dict to list for UI
-                # Format: [{'name': 'Song Name', 'files': [item1, item2], 'status': 'UPDATE'}]
-                ui_data = []
-                for folder_path, files in descargas_pendientes.items():
-                    # Folder path usually is "Artist\Album\Song" or just "Song"
-                    # Let's take the last part as name for display
-                    display_name = folder_path.replace('\\', '/').split('/')[-1]
-                    if not display_name: display_name = folder_path # Fallback
-
-                    # Determine status (if any file is new vs all update)
-                    # Simple rule: if folder exists locally, it's UPDATE, else NEW
-                    local_song_path = os.path.join(rs, folder_path)
-                    status = "UPDATE" if os.path.exists(local_song_path) else "NUEVA"
-                    
-                    ui_data.append({
-                        'name': display_name,
-                        'full_path': folder_path,
-                        'files': files,
-                        'status': status
-                    })
-                
-                # TRIGGER SELECTION UI (Main Thread)
+                # The table is already visible since the first pending song
+                if lote:
+                    self.gui.append_selection(lote)
+                self.gui.set_selection_scanning(False)
                 self.gui.set_status("NUEVOS CHART DETECTADOS", f"Se encontraron {count_songs} canciones.", COLOR_ACENTO)
-                self.pending_results = True # Mark as results pending
-                self.gui.show_selection(ui_data)
                 # Note: We DON'T enable sync button yet, user is in selection mode
 
+        except ScanCancelled:
+            raise
         except Exception as e: 
             self.gui.log(f"ERROR GLOBAL: {e}")
             self.gui.set_status("ERROR CRÍTICO", str(e), COLOR_ACENTO)
+            self.gui.set_selection_scanning(False)
             self.gui.set_sync_enabled(True)
             import traceback
             traceback.print_exc()
 
-    def start_download(self, selected_songs):
+    def start_download(self, selected_songs, encolar=True):
+        if self.downloading:
+            self.gui.log("! Ya hay una descarga en curso.")
+            return
+        self.downloading = True
         self.stop_requested = False
+        if encolar:
+            # Persist the selection so a restart can resume it without a new scan
+            cola_descargas().encolar(selected_songs)
         self.gui.log(f"Iniciando descarga de {len(selected_songs)} elementos...")
         self.gui.set_status("INICIANDO DESCARGA", "Preparando...", COLOR_ACENTO)
         
@@ -259,12 +323,21 @@ class Controller:
         threading.Thread(target=self.download_worker, args=(selected_songs,), daemon=True).start()
 
     def handle_stop_download(self):
-        self.gui.log("! Solicitud de parada enviada. Esperando a terminar archivo actual...")
+        self.gui.log("! Solicitud de parada enviada. Cortando descargas en curso...")
         self.stop_requested = True
+        # Cuts in-flight transfers; their .part files are kept so the next sync resumes them
+        if self.motor_descargas is not None:
+            self.motor_descargas.cancelar()
         self.gui.set_status("DETENIENDO...", "Finalizando tareas...", COLOR_ACENTO)
 
     def cancel_selection(self):
         self.gui.show_home()
+        if self.scanning:
+            # The scan thread stops at its next check and re-enables SYNC when it exits
+            self.scan_cancel.set()
+            self.gui.set_sync_card_mode("SYNC")
+            self.gui.set_status("CANCELANDO...", "Deteniendo el escaneo...", COLOR_ACENTO)
+            return
         self.gui.set_status("CANCELADO", "Sincronización cancelada por usuario.", COLOR_ACENTO)
         self.gui.set_sync_enabled(True)
         if self.pending_results:
@@ -272,70 +345,68 @@ class Controller:
 
     def download_worker(self, descargas_pendientes):
         try:
-            # Get a fresh service and total count
             total_dl = len(descargas_pendientes)
-            completed = 0
             
             self.gui.set_status("DESCARGANDO", f"Preparando {total_dl} archivos...")
             self.gui.set_progress(0) 
+
+            cola = cola_descargas()
             
-            start_dl = time.time()
-
-            def download_task(archivo):
-                # FRESH SERVICE PER THREAD for thread-safety
-                try:
-                    self.gui.set_selection_file_log(archivo['nombre'])
-                    thread_service = self.logic.obtener_servicio()
-                    self.logic.descargar_archivo(thread_service, archivo['id_drive'], archivo['ruta_final'])
-                    return (True, archivo['nombre'])
-                except Exception as e:
-                    return (False, f"{archivo['nombre']}: {e}")
-
-            # Using ThreadPoolExecutor with optimal workers (4)
-            with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
-                futures = {executor.submit(download_task, arch): arch for arch in descargas_pendientes}
-                
-                for future in concurrent.futures.as_completed(futures):
-                    if self.stop_requested:
-                        self.gui.log("! Descarga detenida por el usuario.")
-                        # Shutdown executor without waiting for all futures if necessary
-                        # but as_completed will continue until all scheduled are done.
-                        # To truly stop now, we would need to check inside download_task too.
-                        break
-
-                    completed += 1
-                    success, message = future.result()
-                    
-                    if success:
-                        self.gui.log(f"OK: {message}")
-                    else:
-                        self.gui.log(f"ERR: {message}")
-                    
-                    # ETA Calc
-                    elapsed = time.time() - start_dl
-                    vel = completed / elapsed # files per second
-                    restantes = total_dl - completed
-                    eta = int(restantes / vel) if vel > 0 else 0
-                    mins, segs = divmod(eta, 60)
-                    eta_txt = f"{mins}m {segs}s"
-                    
-                    self.gui.set_status("DESCARGANDO", f"[{completed}/{total_dl}] - Falta: {eta_txt}")
-                    self.gui.set_progress(completed / total_dl)
+            # Los MD5 calculados al descargar van directo a la cache de hashes
+            cache = self.logic.load_cache()
+
+            # Adaptive concurrency + size-aware scheduling; progress and ETA are measured in bytes
+            motor = self.motor_descargas = self.logic.crear_motor_descargas(cache, cola=cola)
+            if self.stop_requested:
+                motor.cancelar()
+            al_iniciar = lambda archivo: self.gui.set_selection_file_log(archivo['nombre'])
+
+            def al_progreso(estado):
+                errores = f", {estado['canciones_con_error']} con errores" if estado['canciones_con_error'] else ""
+                self.gui.set_status("DESCARGANDO", (
+                    f"[{estado['canciones']}/{estado['total_canciones']} canciones, {estado['jugables']} jugables{errores}] "
+                    f"{formato_bytes(estado['bytes'])} de {formato_bytes(estado['total'])} "
+                    f"- {formato_bytes(estado['tasa'])}/s - Falta: {formato_eta(estado['eta'])}"
+                ))
+                self.gui.set_progress(estado['fraccion'])
+
+            # The engine runs the disk preflight itself: songs that don't fit are skipped whole
+            al_aviso = lambda mensaje: self.gui.log(f"! {mensaje}")
+            for archivo, error in motor.descargar(descargas_pendientes, al_iniciar=al_iniciar, al_progreso=al_progreso, al_aviso=al_aviso):
+                if error is None:
+                    self.gui.log(f"OK: {archivo['nombre']}")
+                else:
+                    self.gui.log(f"ERR: {archivo['nombre']}: {error}")
+
+            self.logic.save_cache(cache)
+            resumen, mensajes = motor.terminar_sesion()
+            for texto, es_aviso in mensajes:
+                self.gui.log(f"! {texto}" if es_aviso else texto)
 
+            if motor.sin_espacio():
+                self.gui.set_status("SIN ESPACIO", f"Se necesitan {formato_bytes(motor.espacio_necesario)} libres.", COLOR_ACENTO)
+                self.gui.set_selection_downloading_state(False)
+                return
             if self.stop_requested:
+                self.gui.log("! Descarga detenida por el usuario.")
                 self.gui.set_status("DESCARGA DETENIDA", "Se detuvo el proceso.", COLOR_ACENTO)
                 self.gui.set_selection_downloading_state(False)
             else:
-                self.gui.set_status("PROCESO TERMINADO", f"Se descargaron {len(descargas_pendientes)} archivos.", COLOR_EXITO)
+                self.gui.set_status("PROCESO TERMINADO", f"Se descargaron {len(descargas_pendientes) - len(motor.omitidos)} archivos.", COLOR_EXITO if not motor.omitidos else COLOR_ACENTO)
                 self.gui.set_selection_downloading_state(False)
             
             # Al finalizar, volver al Home
             time.sleep(1)
             self.gui.show_home()
+            if resumen['fallido'] and not self.stop_requested:
+                self.gui.offer_resume(0, resumen['fallido']) # Retry only the failed ones
 
         except Exception as e:
             self.gui.log(f"Error Descarga: {e}")
+            self.gui.set_selection_downloading_state(False)
         finally:
+            self.motor_descargas = None
+            self.downloading = False
             self.gui.set_sync_enabled(True)
 
     def handle_play(self):
@@ -477,4 +548,5 @@ class Controller:
         pass 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Requerido por hash_modo = "procesos" en el .exe
     Controller()
\ No newline at end of file
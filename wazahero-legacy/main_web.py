@@ -2,11 +2,15 @@ import eel
 import os
 import sys
 import threading
+import queue
 import time
 import json
 import ctypes
+import multiprocessing
 import ctypes.wintypes
-from src.core.drive_logic import DriveManager
+from src.core.drive_logic import DriveManager, cola_descargas
+from src.core.stat_index import StatIndex
+from src.core.download_engine import formato_bytes, formato_eta
 
 # Initialize wx App for dialogs (must be in main thread usually, but for simple dialogs inside thread might need care)
 # Actually, for Eel, tkinter can be safer/simpler for just a dialog if wx is overkill, 
@@ -162,14 +166,12 @@ def get_game_stats():
         master_count = 1100 # Fallback
         
         # Try to get real master count
-        master_path = os.path.join(os.getcwd(), 'data', 'master_songs.json')
-        if os.path.exists(master_path):
+        # master_songs.bin or master_songs.json, whichever is local
+        master_path = logic.ruta_manifiesto()
+        if master_path:
             try:
-                with open(master_path, 'r') as f:
-                    master_data = json.load(f)
-                    # Count unique relative paths (songs)
-                    archivos = master_data.get('archivos', [])
-                    master_count = len(set(a['ruta_relativa'] for a in archivos))
+                # Unique relative paths (songs) are precomputed in the index
+                master_count = len(logic.cargar_manifiesto(master_path).carpetas)
             except: pass
 
         if not rs or not os.path.exists(rs):
@@ -189,25 +191,18 @@ def get_game_stats():
 
 @eel.expose
 def get_master_library():
-    """Returns the full master list from master_songs.json."""
-    master_path = os.path.join(os.getcwd(), 'data', 'master_songs.json')
-    if not os.path.exists(master_path):
+    """Returns the full master list from master_songs.bin / master_songs.json."""
+    master_path = logic.ruta_manifiesto()
+    if not master_path:
         return []
     try:
-        with open(master_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            archivos = data.get('archivos', [])
-            # Group by relative path to get unique songs
-            songs = {}
-            for a in archivos:
-                rp = a['ruta_relativa']
-                if rp not in songs:
-                    songs[rp] = {
-                        'name': rp.split('/')[-1] if '/' in rp else rp,
-                        'path': rp,
-                        'is_master': True
-                    }
-            return list(songs.values())
+        # Songs are the precomputed groups of the manifest index
+        manifiesto = logic.cargar_manifiesto(master_path)
+        return [{
+            'name': rp.split('/')[-1] if '/' in rp else rp,
+            'path': rp,
+            'is_master': True
+        } for rp in manifiesto.carpetas]
     except:
         return []
 
@@ -217,29 +212,18 @@ def get_songs_to_sync():
     print("[PY] Scanning for updates...")
     try:
         service = logic.obtener_servicio()
+        rs = logic.obtener_config('ruta_songs')
+        stat_index = StatIndex(rs) if rs else None
         # Explicitly checking if method exists to debug
         if hasattr(logic, 'verificar_actualizaciones'):
-            results = logic.verificar_actualizaciones(service, log_callback=eel.add_log)
+            results = logic.verificar_actualizaciones(service, log_callback=eel.add_log, stat_index=stat_index)
         else:
             eel.add_log("[ERR] El núcleo no responde.")
             return []
         
         ui_data = []
         if results:
-            rs = logic.obtener_config('ruta_songs')
-            for folder_path, files in results.items():
-                display_name = folder_path.replace('\\', '/').split('/')[-1]
-                if not display_name: display_name = folder_path
-                
-                local_song_path = os.path.join(rs, folder_path)
-                status = "UPDATE" if os.path.exists(local_song_path) else "NUEVA"
-                
-                ui_data.append({
-                    'name': display_name,
-                    'full_path': folder_path,
-                    'files': files,
-                    'status': status
-                })
+            ui_data = logic.armar_lista_ui(results, rs, stat_index=stat_index)
         return ui_data
         return ui_data
     except Exception as e:
@@ -331,43 +315,169 @@ def select_folder():
         print(f"[ERR] Dialog error: {e}")
         return ""
 
+# --- DOWNLOADS ---
+# The download engine runs on OS threads; Eel's websocket lives on the gevent loop.
+# Worker threads never call eel.* directly: they queue the calls and a greenlet
+# (spawned with eel.spawn) forwards them, merging progress/status updates.
+ui_queue = queue.Queue()
+ui_pump_started = False
+UI_PUMP_INTERVAL = 0.1
+COALESCED_CALLS = ('update_progress', 'update_status')
+current_engine = None
+# Held from confirm/resume until download_worker ends: one download at a time,
+# also while the worker is still preparing (queue, preflight) before current_engine exists
+download_lock = threading.Lock()
+stop_requested = False
+
+def ui(name, *args):
+    """Thread-safe eel call: queued and sent from the gevent loop."""
+    ui_queue.put((name, args))
+
+def ui_pump():
+    while True:
+        calls = []
+        while True:
+            try:
+                calls.append(ui_queue.get_nowait())
+            except queue.Empty:
+                break
+        # Only the latest progress/status matters; logs are all delivered in order
+        last = {name: i for i, (name, _) in enumerate(calls) if name in COALESCED_CALLS}
+        for i, (name, args) in enumerate(calls):
+            if name in last and last[name] != i:
+                continue
+            try:
+                getattr(eel, name)(*args)
+            except Exception as e:
+                print(f"[ERR] UI call {name} failed: {e}")
+        eel.sleep(UI_PUMP_INTERVAL)
+
+def ensure_ui_pump():
+    global ui_pump_started
+    if not ui_pump_started:
+        ui_pump_started = True
+        eel.spawn(ui_pump)
+
+def start_download_worker(songs, enqueue=True):
+    """Starts download_worker unless one is already running; it releases download_lock when done."""
+    global stop_requested
+    if not download_lock.acquire(blocking=False):
+        eel.add_log("[WAR] Ya hay una descarga en curso.")
+        return False
+    stop_requested = False
+    try:
+        ensure_ui_pump()
+        threading.Thread(target=download_worker, args=(songs, enqueue), daemon=True).start()
+    except Exception:
+        download_lock.release()
+        raise
+    return True
+
 @eel.expose
 def confirm_download(selected_songs):
     print(f"[PY] Confirming download for {len(selected_songs)} songs...")
-    threading.Thread(target=download_worker, args=(selected_songs,), daemon=True).start()
+    start_download_worker(selected_songs)
+
+@eel.expose
+def get_saved_queue():
+    """Pending/failed counts of the persisted queue, so the UI can offer to resume at launch."""
+    resumen = cola_descargas().resumen()
+    return {'pending': resumen['pendiente'], 'failed': resumen['fallido']}
+
+@eel.expose
+def resume_download(mode="all"):
+    """Resumes the saved queue without a new scan: mode 'all', 'failed' (retry only failures) or 'discard'."""
+    cola = cola_descargas()
+    if download_lock.locked():
+        eel.add_log("[WAR] Ya hay una descarga en curso.")
+        return
+    if mode == "discard":
+        cola.vaciar()
+        return
+    files = cola.reintentar_fallidos() if mode == "failed" else cola.pendientes()
+    if not files:
+        return
+    # Same shape as the selection page sends: one group per song folder
+    songs = {}
+    for f in files:
+        songs.setdefault(os.path.dirname(f['ruta_final']), []).append(f)
+    start_download_worker([{'files': g} for g in songs.values()], enqueue=False)
 
-def download_worker(songs):
+@eel.expose
+def stop_download():
+    """Cuts in-flight transfers; their .part files are kept for the next sync."""
+    global stop_requested
+    print("[PY] Stop requested.")
+    if download_lock.locked():
+        # The worker may still be preparing: it cancels its engine as soon as it creates it
+        stop_requested = True
+        if current_engine is not None:
+            current_engine.cancelar()
+        eel.update_status("DETENIENDO...", "Cortando descargas en curso...", "#c8aa6e")
+
+def download_worker(songs, enqueue=True):
+    global current_engine
     try:
         total_files = sum(len(s['files']) for s in songs)
         completed = 0
         
-        eel.add_log(f"Iniciando descarga de {len(songs)} canciones ({total_files} archivos)...")
-        eel.update_status("DESCARGANDO", f"Preparando {total_files} archivos...", "#c8aa6e")
+        ui('add_log', f"Iniciando descarga de {len(songs)} canciones ({total_files} archivos)...")
+        ui('update_status', "DESCARGANDO", f"Preparando {total_files} archivos...", "#c8aa6e")
         
         all_files = []
         for song in songs:
             for f in song['files']:
                 all_files.append(f)
 
-        service = logic.obtener_servicio()
-        for i, archivo in enumerate(all_files):
-            try:
-                logic.descargar_archivo(service, archivo['id_drive'], archivo['ruta_final'])
+        # Persisted queue: a restart can resume (or retry only failures) without rescanning
+        cola = cola_descargas()
+        if enqueue:
+            cola.encolar(all_files)
+
+        cache = logic.load_cache() # MD5 calculado al descargar, sin releer el archivo después
+        # Mismo motor que la versión de escritorio: concurrencia adaptativa, cancelable y progreso en bytes
+        motor = current_engine = logic.crear_motor_descargas(cache, cola=cola)
+        if stop_requested:
+            motor.cancelar()
+
+        def al_progreso(estado):
+            errores = f", {estado['canciones_con_error']} con errores" if estado['canciones_con_error'] else ""
+            ui('update_progress', estado['fraccion'])
+            ui('update_status', "DESCARGANDO", (
+                f"[{estado['canciones']}/{estado['total_canciones']} canciones, {estado['jugables']} jugables{errores}] "
+                f"{formato_bytes(estado['bytes'])} de {formato_bytes(estado['total'])} "
+                f"- {formato_bytes(estado['tasa'])}/s - Falta: {formato_eta(estado['eta'])}"
+            ), "#c8aa6e")
+
+        # The engine runs the disk preflight itself: songs that don't fit are skipped whole
+        al_aviso = lambda mensaje: ui('add_log', f"[WAR] {mensaje}")
+        for archivo, error in motor.descargar(all_files, al_progreso=al_progreso, al_aviso=al_aviso):
+            if error is None:
                 completed += 1
-                progress = completed / total_files
-                eel.update_progress(progress)
-                eel.add_log(f"Descargado: {archivo['nombre']}")
-                eel.update_status("DESCARGANDO", f"[{completed}/{total_files}] - {archivo['nombre']}", "#c8aa6e")
-            except Exception as e:
-                eel.add_log(f"[ERR] Error en {archivo['nombre']}: {e}")
-                print(f"[ERR] File error: {e}")
-
-        eel.add_log(f"Sincronización completa: {completed} archivos recibidos.")
-        eel.update_status("COMPLETO", f"Sincronizados {completed} archivos.", "#30d158")
-        eel.update_progress(1.0)
+                ui('add_log', f"Descargado: {archivo['nombre']}")
+            else:
+                ui('add_log', f"[ERR] Error en {archivo['nombre']}: {error}")
+                print(f"[ERR] File error: {error}")
+        logic.save_cache(cache)
+        _, mensajes = motor.terminar_sesion()
+        for texto, es_aviso in mensajes:
+            ui('add_log', f"[WAR] {texto}" if es_aviso else texto)
+
+        if motor.sin_espacio():
+            ui('update_status', "SIN ESPACIO", f"Se necesitan {formato_bytes(motor.espacio_necesario)} libres.", "#ff4655")
+        elif motor.cancelado():
+            ui('add_log', f"Descarga detenida: {completed} archivos recibidos. Lo pendiente se reanudará en la próxima sincronización.")
+            ui('update_status', "DESCARGA DETENIDA", f"Se recibieron {completed} archivos.", "#c8aa6e")
+        else:
+            ui('add_log', f"Sincronización completa: {completed} archivos recibidos.")
+            ui('update_status', "COMPLETO", f"Sincronizados {completed} archivos.", "#30d158")
+            ui('update_progress', 1.0)
     except Exception as e:
         print(f"[ERR] Worker error: {e}")
-        eel.update_status("ERROR", str(e), "#ff4655")
+        ui('update_status', "ERROR", str(e), "#ff4655")
+    finally:
+        current_engine = None
+        download_lock.release()
 
 # --- APP START ---
 
@@ -388,6 +498,17 @@ def start_app():
         return
         
     eel.init(directory)
+
+    # Recover downloads interrupted by a crash before the UI can start new ones
+    try:
+        instalados, reanudables = logic.recuperar_descargas()
+        if instalados or reanudables:
+            print(f"[PY] Journal replay: {instalados} installed, {reanudables} resumable.")
+    except Exception as e:
+        print(f"[ERR] Journal replay failed: {e}")
+    resumen = cola_descargas().resumen()
+    if resumen['pendiente'] or resumen['fallido']:
+        print(f"[PY] Saved download queue: {resumen['pendiente']} pending, {resumen['fallido']} failed.")
     
     chrome_flags = [
         '--app-id=wazahero-web',
@@ -464,4 +585,5 @@ def start_app():
     eel.start('index.html', size=(1280, 720), mode='chrome', cmdline_args=chrome_flags)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # Requerido por hash_modo = "procesos" en el .exe
     start_app()
@@ -0,0 +1,76 @@
+import time
+import datetime
+import threading
+
+# Bytes de ráfaga permitidos, en segundos de la tasa configurada
+RAFAGA_SEG = 1.0
+TRAMO_MINIMO = 64 * 1024
+
+
+def _minutos(hhmm):
+    horas, mins = str(hhmm).split(':')
+    return int(horas) * 60 + int(mins)
+
+
+class LimitadorBanda:
+    """
+    Token bucket compartido por todas las descargas del launcher.
+
+    - limite_kb_s: tope en KB/s (None o 0 = sin límite).
+    - horario: lista opcional de tramos {"desde": "HH:MM", "hasta": "HH:MM", "kb_s": n}
+      que reemplazan el tope en esas horas (kb_s 0 = sin límite, p. ej. de noche).
+      Un tramo puede cruzar la medianoche ("23:00" -> "07:00").
+    Cada hilo descuenta los bytes que recibe; si el balde queda en negativo,
+    espera lo necesario, así el total entre todos los hilos respeta el tope.
+    """
+
+    def __init__(self, limite_kb_s=None, horario=None):
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._ultimo = time.monotonic()
+        self.configurar(limite_kb_s, horario)
+
+    def configurar(self, limite_kb_s=None, horario=None):
+        with self._lock:
+            self.limite_kb_s = limite_kb_s or None
+            self.horario = horario or []
+
+    def tasa_actual(self, ahora=None):
+        """Bytes/s permitidos en este momento, o None si no hay límite."""
+        ahora = ahora or datetime.datetime.now()
+        minuto = ahora.hour * 60 + ahora.minute
+        kb_s = self.limite_kb_s
+        for tramo in self.horario:
+            try:
+                desde, hasta = _minutos(tramo['desde']), _minutos(tramo['hasta'])
+            except (KeyError, ValueError, TypeError):
+                continue
+            dentro = desde <= minuto < hasta if desde <= hasta else (minuto >= desde or minuto < hasta)
+            if dentro:
+                kb_s = tramo.get('kb_s') or None
+                break
+        return float(kb_s) * 1024 if kb_s else None
+
+    def tramo_sugerido(self, chunksize):
+        """Tamaño de petición que no rompe el límite en ráfagas (medio segundo de tasa)."""
+        tasa = self.tasa_actual()
+        if tasa is None:
+            return chunksize
+        return max(TRAMO_MINIMO, min(chunksize, int(tasa / 2)))
+
+    def consumir(self, n, cancelar=None):
+        """Descuenta n bytes del balde y espera si se pasó del límite."""
+        tasa = self.tasa_actual()
+        if tasa is None:
+            return
+        with self._lock:
+            ahora = time.monotonic()
+            self._tokens = min(tasa * RAFAGA_SEG, self._tokens + (ahora - self._ultimo) * tasa)
+            self._ultimo = ahora
+            self._tokens -= n
+            espera = -self._tokens / tasa if self._tokens < 0 else 0.0
+        if espera > 0:
+            if cancelar is not None:
+                cancelar.wait(espera)
+            else:
+                time.sleep(espera)
@@ -0,0 +1,565 @@
+import os
+import time
+import queue
+import shutil
+import threading
+from collections import deque
+
+from src.core.transfer import Cancelacion, DescargaCancelada, ruta_parcial
+from src.core.download_queue import PENDIENTE, EN_CURSO, HECHO, FALLIDO
+
+# Límites por defecto (configurables con 'descargas_min' / 'descargas_max' en launcher_config.json)
+DESCARGAS_MIN = 2
+DESCARGAS_MAX = 12
+DESCARGAS_INICIAL = 4
+VENTANA_MEDICION = 3.0   # Segundos entre ajustes
+MEJORA_MINIMA = 1.05     # Un aumento de concurrencia se mantiene si la tasa sube al menos un 5%
+VENTANAS_EN_PAUSA = 5    # Ventanas sin probar más concurrencia tras un recorte
+ARCHIVO_GRANDE = 8 * 1024 * 1024 # A partir de aquí un archivo cuenta como "grande" al planificar
+INTERVALO_PROGRESO = 0.5 # Segundos entre avisos de progreso a la UI
+SUAVIZADO_TASA = 0.3     # Peso de la última medición en la tasa para el ETA
+ESPERA_CANCELACION = 1.0 # Segundos que se espera a los hilos al cancelar
+RESERVA_DISCO = 256 * 1024 * 1024 # Espacio que la sincronización deja libre en la unidad
+
+# Prioridad por tipo de archivo: lo que hace falta para jugar, luego portada, luego el resto (video)
+EXT_JUGABLES = {'.chart', '.mid', '.ini', '.ogg', '.opus', '.mp3', '.wav'}
+EXT_ARTE = {'.png', '.jpg', '.jpeg'}
+PRIORIDAD_JUGABLE, PRIORIDAD_ARTE, PRIORIDAD_RESTO = 0, 1, 2
+
+
+class ControlConcurrencia:
+    """
+    Decide cuántas descargas pueden estar activas a la vez (AIMD):
+    - suma una más mientras la tasa medida (bytes/s) siga mejorando,
+    - vuelve atrás si el último aumento no mejoró la tasa,
+    - divide a la mitad si hubo 429/5xx o cortes de red en la ventana.
+    Siempre dentro de [minimo, maximo].
+    """
+
+    def __init__(self, minimo=DESCARGAS_MIN, maximo=DESCARGAS_MAX, inicial=DESCARGAS_INICIAL, ventana=VENTANA_MEDICION):
+        self.minimo = max(1, int(minimo))
+        self.maximo = max(self.minimo, int(maximo))
+        self.limite = min(self.maximo, max(self.minimo, int(inicial or DESCARGAS_INICIAL)))
+        self.ventana = ventana
+        self.activas = 0
+        self._cond = threading.Condition()
+        self._esperando = 0
+        self._bytes = 0
+        self._errores = 0
+        self._inicio = time.monotonic()
+        self._tasa_anterior = 0.0
+        self._subiendo = False
+        self._pausa = 0
+
+    def adquirir(self):
+        """Bloquea hasta que haya un hueco bajo el límite actual."""
+        with self._cond:
+            self._esperando += 1
+            while self.activas >= self.limite:
+                self._cond.wait(0.5)
+                self._ajustar()
+            self._esperando -= 1
+            self.activas += 1
+
+    def liberar(self):
+        with self._cond:
+            self.activas -= 1
+            self._cond.notify()
+
+    def registrar_bytes(self, n):
+        with self._cond:
+            self._bytes += n
+            self._ajustar()
+
+    def registrar_error(self, motivo=None):
+        """429/5xx o error de red: la próxima ventana recorta la concurrencia."""
+        with self._cond:
+            self._errores += 1
+            self._ajustar()
+
+    def tasa(self):
+        """Bytes/s de la última ventana completa."""
+        return self._tasa_anterior
+
+    def _ajustar(self):
+        # Se llama con el lock tomado
+        ahora = time.monotonic()
+        transcurrido = ahora - self._inicio
+        if transcurrido < self.ventana:
+            return
+        tasa = self._bytes / transcurrido
+
+        if self._errores:
+            self.limite = max(self.minimo, self.limite // 2)
+            self._subiendo = False
+            self._pausa = VENTANAS_EN_PAUSA
+        elif self._subiendo and tasa < self._tasa_anterior * MEJORA_MINIMA:
+            # El último aumento no aportó: el enlace ya está saturado
+            self.limite = max(self.minimo, self.limite - 1)
+            self._subiendo = False
+            self._pausa = VENTANAS_EN_PAUSA
+        elif self._pausa:
+            self._pausa -= 1
+            self._subiendo = False
+        elif self._esperando and self.activas >= self.limite and self.limite < self.maximo:
+            # Hay trabajo en cola y todos los huecos ocupados: probar una más
+            self.limite += 1
+            self._subiendo = True
+        else:
+            self._subiendo = False
+
+        self._tasa_anterior = tasa
+        self._bytes = 0
+        self._errores = 0
+        self._inicio = ahora
+        self._cond.notify_all()
+
+
+def tamano_de(archivo):
+    try:
+        return max(0, int(archivo.get('tamano') or 0))
+    except (TypeError, ValueError):
+        return 0
+
+
+def cancion_de(archivo):
+    """Carpeta de la canción a la que pertenece el archivo."""
+    return os.path.dirname(archivo['ruta_final'])
+
+
+def prioridad_de(archivo):
+    ext = os.path.splitext(archivo.get('nombre') or archivo['ruta_final'])[1].lower()
+    if ext in EXT_JUGABLES:
+        return PRIORIDAD_JUGABLE
+    if ext in EXT_ARTE:
+        return PRIORIDAD_ARTE
+    return PRIORIDAD_RESTO
+
+
+def _unidad(carpeta):
+    """Carpeta existente más cercana (la canción puede no existir aún) y su dispositivo."""
+    while not os.path.isdir(carpeta):
+        padre = os.path.dirname(carpeta)
+        if padre == carpeta:
+            break
+        carpeta = padre
+    return carpeta, os.stat(carpeta).st_dev
+
+
+def espacio_necesario(archivo):
+    """Bytes que faltan escribir: lo ya descargado en un .part no vuelve a ocupar."""
+    try:
+        ya = os.path.getsize(ruta_parcial(archivo['ruta_final']))
+    except OSError:
+        ya = 0
+    return max(0, tamano_de(archivo) - ya)
+
+
+def comprobar_espacio(archivos, reserva=RESERVA_DISCO):
+    """
+    Preflight antes de descargar: suma los bytes por unidad de disco y los
+    compara con el espacio libre (menos 'reserva'). Si no cabe todo, recorta
+    el plan por canciones enteras (las más livianas primero, así entran más).
+    Retorna (aceptados, omitidos, necesarios, libres) en el orden original.
+    """
+    libres = {}
+    por_cancion = {}
+    unidades = {}
+    for a in archivos:
+        c = cancion_de(a)
+        if c not in unidades:
+            carpeta, dispositivo = _unidad(c)
+            unidades[c] = dispositivo
+            if dispositivo not in libres:
+                libres[dispositivo] = max(0, shutil.disk_usage(carpeta).free - reserva)
+        por_cancion[c] = por_cancion.get(c, 0) + espacio_necesario(a)
+
+    necesarios = sum(por_cancion.values())
+    disponibles = dict(libres)
+    entran = set()
+    for c in sorted(por_cancion, key=lambda c: (por_cancion[c], c)):
+        if por_cancion[c] <= disponibles[unidades[c]]:
+            disponibles[unidades[c]] -= por_cancion[c]
+            entran.add(c)
+    aceptados = [a for a in archivos if cancion_de(a) in entran]
+    omitidos = [a for a in archivos if cancion_de(a) not in entran]
+    return aceptados, omitidos, necesarios, sum(libres.values())
+
+
+def agrupar_por_contenido(archivos):
+    """
+    Un archivo por MD5: retorna (unicos, copias) donde copias[id(unico)] son las
+    demás entradas con el mismo hash (portadas, fondos o stems repetidos entre
+    canciones). Las entradas sin hash se descargan cada una.
+    """
+    unicos = []
+    copias = {}
+    por_hash = {}
+    for a in archivos:
+        h = a.get('hash')
+        if h and h in por_hash:
+            copias[id(por_hash[h])].append(a)
+            continue
+        if h:
+            por_hash[h] = a
+            copias[id(a)] = []
+        unicos.append(a)
+    return unicos, copias
+
+
+def formato_bytes(n):
+    for unidad in ('B', 'KB', 'MB', 'GB'):
+        if n < 1024 or unidad == 'GB':
+            return f"{n:.0f} {unidad}" if unidad == 'B' else f"{n:.1f} {unidad}"
+        n /= 1024
+
+
+def formato_eta(segundos):
+    if segundos is None:
+        return "--"
+    mins, segs = divmod(int(segundos), 60)
+    horas, mins = divmod(mins, 60)
+    return f"{horas}h {mins}m" if horas else f"{mins}m {segs}s"
+
+
+class Planificador:
+    """
+    Reparte los archivos a los hilos para que cada canción sea jugable cuanto
+    antes: primero chart, ini y audio (canción por canción, las más livianas
+    primero), después portadas y al final videos. Dentro de eso mezcla grandes
+    y pequeños: como mucho la mitad de las descargas activas son archivos
+    grandes, el resto avanza por los pequeños, así un video de 400 MB nunca
+    deja la cola parada detrás de él.
+    """
+
+    def __init__(self, archivos, control):
+        self.control = control
+        # Orden de las canciones según lo que falta para poder jugarlas
+        peso = {}
+        for a in archivos:
+            if prioridad_de(a) == PRIORIDAD_JUGABLE:
+                peso[cancion_de(a)] = peso.get(cancion_de(a), 0) + tamano_de(a)
+        orden = {c: n for n, c in enumerate(sorted(peso, key=lambda c: (peso[c], c)))}
+
+        def clave(a):
+            prioridad = prioridad_de(a)
+            if prioridad == PRIORIDAD_JUGABLE:
+                return (prioridad, orden[cancion_de(a)], tamano_de(a))
+            # Portadas y videos no bloquean el juego: el mayor primero entre los grandes
+            return (prioridad, 0, -tamano_de(a) if tamano_de(a) >= ARCHIVO_GRANDE else tamano_de(a))
+
+        ordenados = sorted(archivos, key=clave)
+        self._grandes = deque(a for a in ordenados if tamano_de(a) >= ARCHIVO_GRANDE)
+        self._pequenos = deque(a for a in ordenados if tamano_de(a) < ARCHIVO_GRANDE)
+        self._grandes_activos = 0
+        self._cerrado = False
+        self._lock = threading.Lock()
+
+    def pendientes(self):
+        with self._lock:
+            return 0 if self._cerrado else len(self._grandes) + len(self._pequenos)
+
+    def siguiente(self):
+        with self._lock:
+            if self._cerrado:
+                return None
+            cupo_grandes = max(1, self.control.limite // 2)
+            if self._grandes and self._pequenos:
+                # Los grandes usan su cupo salvo que haya pequeños más prioritarios (un video
+                # espera a los chart/audio); uno necesario para jugar no espera a portadas
+                prioridad_g, prioridad_p = prioridad_de(self._grandes[0]), prioridad_de(self._pequenos[0])
+                tomar_grande = prioridad_g < prioridad_p or (prioridad_g == prioridad_p and self._grandes_activos < cupo_grandes)
+            else:
+                tomar_grande = bool(self._grandes)
+            if tomar_grande:
+                self._grandes_activos += 1
+                return self._grandes.popleft()
+            if self._pequenos:
+                return self._pequenos.popleft()
+            return None
+
+    def terminado(self, archivo):
+        if tamano_de(archivo) >= ARCHIVO_GRANDE:
+            with self._lock:
+                self._grandes_activos -= 1
+
+    def cerrar(self):
+        with self._lock:
+            self._cerrado = True
+
+
+class ProgresoBytes:
+    """
+    Progreso y ETA en bytes (según 'tamano' del maestro y los bytes realmente
+    recibidos), más canciones jugables (chart/ini/audio listos) y completas.
+    Un archivo que falla sale del total de bytes y su canción deja de contar
+    como completa (y como jugable, si el que falló era chart/ini/audio).
+    """
+
+    def __init__(self, archivos):
+        self.total = sum(tamano_de(a) for a in archivos)
+        self.total_archivos = len(archivos)
+        self.bytes = 0
+        self.archivos = 0
+        self.fallidos = 0
+        self._con_error = set()          # Canciones con algún archivo fallido
+        self._con_error_jugable = set()  # ... y entre ellos uno necesario para jugar
+        self._faltan = {}           # canción -> archivos pendientes
+        self._faltan_jugables = {}  # canción -> archivos para jugar pendientes
+        for a in archivos:
+            c = cancion_de(a)
+            self._faltan[c] = self._faltan.get(c, 0) + 1
+            self._faltan_jugables.setdefault(c, 0)
+            if prioridad_de(a) == PRIORIDAD_JUGABLE:
+                self._faltan_jugables[c] += 1
+        self.total_canciones = len(self._faltan)
+        self.canciones = 0
+        self.jugables = sum(1 for n in self._faltan_jugables.values() if n == 0)
+        self._red = 0 # Solo bytes recibidos por la red: base de la tasa
+        self._por_archivo = {}
+        self._lock = threading.Lock()
+        self._inicio = time.monotonic()
+        self._ultimo = (self._inicio, 0)
+        self._tasa = None
+
+    def recibido(self, archivo, n):
+        with self._lock:
+            self.bytes += n
+            self._red += n
+            self._por_archivo[id(archivo)] = self._por_archivo.get(id(archivo), 0) + n
+
+    def completado(self, archivo, error=None):
+        with self._lock:
+            vistos = self._por_archivo.pop(id(archivo), 0)
+            jugable = prioridad_de(archivo) == PRIORIDAD_JUGABLE
+            c = cancion_de(archivo)
+            self.archivos += 1
+            if error is None:
+                # Lo reanudado de un .part anterior no pasó por recibido(): se completa aquí
+                self.bytes += max(0, tamano_de(archivo) - vistos)
+            else:
+                self.bytes -= vistos
+                self.total -= tamano_de(archivo)
+                self.fallidos += 1
+                self._con_error.add(c)
+                if jugable:
+                    self._con_error_jugable.add(c)
+            if jugable:
+                self._faltan_jugables[c] -= 1
+                if self._faltan_jugables[c] == 0 and c not in self._con_error_jugable:
+                    self.jugables += 1
+            self._faltan[c] -= 1
+            if self._faltan[c] == 0 and c not in self._con_error:
+                self.canciones += 1
+
+    def estado(self):
+        """
+        Dict con bytes, total, fraccion, archivos, fallidos, canciones (completas),
+        jugables, canciones_con_error, total_canciones, tasa (B/s suavizada) y
+        eta (segundos o None).
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            t0, b0 = self._ultimo
+            if ahora - t0 >= INTERVALO_PROGRESO:
+                medida = (self._red - b0) / (ahora - t0)
+                self._tasa = medida if self._tasa is None else SUAVIZADO_TASA * medida + (1 - SUAVIZADO_TASA) * self._tasa
+                self._ultimo = (ahora, self._red)
+            restante = max(0, self.total - self.bytes)
+            return {
+                'bytes': self.bytes,
+                'total': self.total,
+                'fraccion': (self.bytes / self.total) if self.total else (self.archivos / max(1, self.total_archivos)),
+                'archivos': self.archivos,
+                'total_archivos': self.total_archivos,
+                'fallidos': self.fallidos,
+                'canciones': self.canciones,
+                'canciones_con_error': len(self._con_error),
+                'jugables': self.jugables,
+                'total_canciones': self.total_canciones,
+                'tasa': self._tasa or 0.0,
+                'eta': (restante / self._tasa) if self._tasa else None,
+            }
+
+
+class MotorDescargas:
+    """
+    Descarga archivos del maestro (dicts con id_drive, ruta_final, hash y tamano)
+    con hasta 'maximo' hilos; el ControlConcurrencia decide cuántos transfieren a
+    la vez y el Planificador qué archivo toma cada uno. Los archivos con el mismo
+    MD5 se bajan una sola vez (o ninguna, si ya hay uno idéntico en disco) y se
+    instalan con hardlink o copia. Lo usan main.py y main_web.py.
+    """
+
+    def __init__(self, logic, control=None, cache=None, cola=None):
+        self.logic = logic
+        self.control = control or ControlConcurrencia()
+        self.cache = cache
+        self.cola = cola # DownloadQueue opcional: registra el estado de cada archivo en disco
+        self.progreso = None
+        self.cancelacion = Cancelacion()
+        self.reutilizados = 0       # Archivos instalados desde otro idéntico, sin descargarlos
+        self.bytes_reutilizados = 0
+        self.omitidos = []          # Archivos que el preflight dejó fuera por falta de espacio
+        self.espacio_necesario = 0
+        self.espacio_libre = 0
+        self._copias = {}
+        self._lock = threading.Lock()
+
+    def cancelar(self):
+        """
+        Detiene la sesión: no se toman más archivos y las transferencias en curso
+        se cortan (sus .part quedan para reanudar). Seguro desde cualquier hilo.
+        """
+        self.cancelacion.set()
+
+    def cancelado(self):
+        return self.cancelacion.is_set()
+
+    def sin_espacio(self):
+        """True si el preflight no dejó nada por descargar."""
+        return bool(self.omitidos) and self.progreso is not None and not self.progreso.total_archivos
+
+    def _descargar_uno(self, archivo, al_iniciar):
+        if al_iniciar:
+            al_iniciar(archivo)
+        service = self.logic.obtener_servicio()
+
+        def recibido(n):
+            self.progreso.recibido(archivo, n)
+            self.control.registrar_bytes(n)
+
+        try:
+            origen = self.logic.buscar_local(archivo.get('hash'), archivo['ruta_final'], self.cache)
+            if origen:
+                self._copiar(origen, archivo)
+                return None
+            self.logic.descargar_archivo(
+                service, archivo['id_drive'], archivo['ruta_final'], archivo.get('hash'), self.cache,
+                tamano_esperado=archivo.get('tamano'), progreso=recibido, al_reintentar=self.control.registrar_error, cancelar=self.cancelacion
+            )
+            return None
+        except DescargaCancelada:
+            raise
+        except Exception as e:
+            if self.cancelacion.is_set():
+                raise DescargaCancelada() from e
+            # Sin registrar_error: los 429/5xx y cortes de red ya llegaron por al_reintentar;
+            # un 404, un MD5 distinto o un error de disco no dicen nada de la conexión
+            return str(e)
+
+    def _copiar(self, origen, archivo):
+        self.logic.instalar_copia(origen, archivo['ruta_final'], archivo.get('hash'), self.cache, archivo.get('id_drive'))
+        with self._lock:
+            self.reutilizados += 1
+            self.bytes_reutilizados += tamano_de(archivo)
+
+    def _entregar(self, archivo, error, resultados):
+        if self.cola is not None:
+            self.cola.marcar(archivo, HECHO if error is None else FALLIDO, error)
+        self.progreso.completado(archivo, error)
+        resultados.put((archivo, error))
+
+    def _instalar_copias(self, archivo, error, resultados):
+        """Las entradas con el mismo contenido salen del archivo recién instalado (o heredan su error)."""
+        for copia in self._copias.get(id(archivo), ()):
+            error_copia = error
+            if error is None:
+                try:
+                    self._copiar(archivo['ruta_final'], copia)
+                except Exception as e:
+                    error_copia = str(e)
+            self._entregar(copia, error_copia, resultados)
+
+    def _trabajador(self, plan, resultados, al_iniciar):
+        while plan.pendientes():
+            self.control.adquirir()
+            archivo = plan.siguiente()
+            if archivo is None or self.cancelacion.is_set():
+                self.control.liberar()
+                return
+            if self.cola is not None:
+                self.cola.marcar(archivo, EN_CURSO)
+            try:
+                error = self._descargar_uno(archivo, al_iniciar)
+            except DescargaCancelada:
+                return # Queda en_curso en la cola: se reanuda como pendiente
+            finally:
+                plan.terminado(archivo)
+                self.control.liberar()
+            self._entregar(archivo, error, resultados)
+            self._instalar_copias(archivo, error, resultados)
+
+    def descargar(self, archivos, al_iniciar=None, al_progreso=None, al_aviso=None):
+        """
+        Genera (archivo, error) a medida que terminan; error es None si la descarga fue bien.
+        al_progreso(estado) recibe ProgresoBytes.estado() cada INTERVALO_PROGRESO segundos.
+        Antes de empezar comprueba el espacio en disco: las canciones que no caben
+        quedan en self.omitidos (fallidas en la cola) y se avisa con al_aviso(mensaje).
+        """
+        archivos, self.omitidos, self.espacio_necesario, self.espacio_libre = comprobar_espacio(list(archivos))
+        if self.omitidos:
+            if self.cola is not None:
+                for archivo in self.omitidos:
+                    self.cola.marcar(archivo, FALLIDO, "Sin espacio en disco")
+            if al_aviso:
+                canciones = len({cancion_de(a) for a in self.omitidos})
+                al_aviso(f"Espacio insuficiente: se necesitan {formato_bytes(self.espacio_necesario)} "
+                         f"y hay {formato_bytes(self.espacio_libre)} libres.")
+                al_aviso(f"Se omiten {len(self.omitidos)} archivos de {canciones} canciones.")
+        # Cada contenido (MD5) se descarga una vez; las demás entradas se instalan desde él
+        unicos, self._copias = agrupar_por_contenido(archivos)
+        plan = Planificador(unicos, self.control)
+        self.progreso = ProgresoBytes(archivos)
+        resultados = queue.Queue()
+        hilos = [
+            threading.Thread(target=self._trabajador, args=(plan, resultados, al_iniciar), name=f"descarga-{n}", daemon=True)
+            for n in range(min(self.control.maximo, len(unicos)))
+        ]
+        for hilo in hilos:
+            hilo.start()
+
+        try:
+            entregados = 0
+            ultimo_aviso = 0.0
+            while entregados < len(archivos) and not self.cancelacion.is_set():
+                try:
+                    resultado = resultados.get(timeout=INTERVALO_PROGRESO)
+                except queue.Empty:
+                    resultado = None
+                if al_progreso and time.monotonic() - ultimo_aviso >= INTERVALO_PROGRESO:
+                    ultimo_aviso = time.monotonic()
+                    al_progreso(self.progreso.estado())
+                if resultado is not None:
+                    entregados += 1
+                    yield resultado
+                elif not any(h.is_alive() for h in hilos) and resultados.empty():
+                    break
+            if al_progreso:
+                al_progreso(self.progreso.estado())
+        finally:
+            # Si el consumidor abandona, no se toman más archivos y se espera a los que
+            # están en curso; si se canceló, como mucho ESPERA_CANCELACION segundos
+            plan.cerrar()
+            limite_espera = time.monotonic() + ESPERA_CANCELACION if self.cancelacion.is_set() else None
+            for hilo in hilos:
+                hilo.join(None if limite_espera is None else max(0.0, limite_espera - time.monotonic()))
+
+    def terminar_sesion(self):
+        """
+        Cierre común de una sesión de descarga: si la cola no tiene pendientes ni
+        fallidos se vacía. Retorna (resumen de la cola, mensajes), donde mensajes
+        es una lista de (texto, es_aviso) para el log del launcher.
+        """
+        mensajes = []
+        if self.reutilizados:
+            mensajes.append((f"Reutilizados {self.reutilizados} archivos idénticos "
+                             f"({formato_bytes(self.bytes_reutilizados)} sin descargar).", False))
+        if self.cola is None:
+            return {}, mensajes
+        resumen = self.cola.resumen()
+        if resumen[FALLIDO]:
+            mensajes.append((f"{resumen[FALLIDO]} archivos fallaron. Se pueden reintentar solo esos.", True))
+        elif not resumen[PENDIENTE]:
+            self.cola.vaciar()
+        return resumen, mensajes
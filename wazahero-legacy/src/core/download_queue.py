@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+QUEUE_DB = os.path.join('data', 'download_queue.db')
+
+PENDIENTE = 'pendiente'
+EN_CURSO = 'en_curso'
+HECHO = 'hecho'
+FALLIDO = 'fallido'
+
+
+class DownloadQueue:
+    """
+    Cola de descargas persistente (data/download_queue.db). Guarda el plan que
+    eligió el usuario con el estado de cada archivo: pendiente, en_curso, hecho
+    o fallido (con el motivo). Si el launcher se cierra o se cae, al volver a
+    abrirlo se puede reanudar sin escanear ni elegir de nuevo, o reintentar
+    solo los fallidos. Un en_curso que sobrevivió a un cierre cuenta como pendiente.
+    """
+
+    def __init__(self, ruta_db=QUEUE_DB):
+        self.ruta_db = ruta_db
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(ruta_db) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(ruta_db, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS archivos ("
+            " ruta TEXT PRIMARY KEY,"
+            " orden INTEGER NOT NULL,"
+            " datos TEXT NOT NULL,"
+            " estado TEXT NOT NULL,"
+            " motivo TEXT,"
+            " actualizado REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def encolar(self, archivos):
+        """Reemplaza la cola por un plan nuevo (todo pendiente)."""
+        ahora = time.time()
+        filas = [
+            (os.path.abspath(a['ruta_final']), n, json.dumps(a, ensure_ascii=False), PENDIENTE, ahora)
+            for n, a in enumerate(archivos)
+        ]
+        with self._lock:
+            self._conn.execute("DELETE FROM archivos")
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archivos (ruta, orden, datos, estado, actualizado) VALUES (?, ?, ?, ?, ?)", filas
+            )
+            self._conn.commit()
+
+    def marcar(self, archivo, estado, motivo=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE archivos SET estado = ?, motivo = ?, actualizado = ? WHERE ruta = ?",
+                (estado, motivo, time.time(), os.path.abspath(archivo['ruta_final']))
+            )
+            self._conn.commit()
+
+    def _listar(self, estados):
+        marcas = ', '.join('?' * len(estados))
+        with self._lock:
+            filas = self._conn.execute(
+                f"SELECT datos FROM archivos WHERE estado IN ({marcas}) ORDER BY orden", estados
+            ).fetchall()
+        return [json.loads(datos) for (datos,) in filas]
+
+    def pendientes(self):
+        """Archivos por descargar, incluidos los que quedaron en_curso por un cierre."""
+        return self._listar((PENDIENTE, EN_CURSO))
+
+    def fallidos(self):
+        """Lista de (archivo, motivo) de los que fallaron."""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT datos, motivo FROM archivos WHERE estado = ? ORDER BY orden", (FALLIDO,)
+            ).fetchall()
+        return [(json.loads(datos), motivo) for datos, motivo in filas]
+
+    def reintentar_fallidos(self):
+        """Vuelve a poner los fallidos como pendientes y los retorna."""
+        archivos = [a for a, _ in self.fallidos()]
+        with self._lock:
+            self._conn.execute("UPDATE archivos SET estado = ?, motivo = NULL WHERE estado = ?", (PENDIENTE, FALLIDO))
+            self._conn.commit()
+        return archivos
+
+    def resumen(self):
+        """Dict estado -> cantidad (en_curso se suma a pendiente)."""
+        conteo = {PENDIENTE: 0, HECHO: 0, FALLIDO: 0}
+        with self._lock:
+            filas = self._conn.execute("SELECT estado, COUNT(*) FROM archivos GROUP BY estado").fetchall()
+        for estado, n in filas:
+            estado = PENDIENTE if estado == EN_CURSO else estado
+            conteo[estado] = conteo.get(estado, 0) + n
+        return conteo
+
+    def vaciar(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM archivos")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,13 +1,23 @@
 import os
 import json
-import io
 import socket
-from googleapiclient.discovery import build
+import threading
 from google.oauth2 import service_account
-from googleapiclient.http import MediaIoBaseDownload
 
-import hashlib
 from src.utils.resource_utils import resource_path
+from src.core.hash_engine import HashEngine, calcular_md5
+from src.core.hash_store import HashStore
+from src.core.stat_index import StatIndex
+from src.core.sync_snapshot import SyncSnapshot, clave_archivo
+from src.core.manifest_index import ManifestIndex
+from src.core import manifest_bin
+from src.core import transfer
+from src.core.drive_service import ServicePool
+from src.core.token_provider import TokenCompartido
+from src.core.bandwidth import LimitadorBanda
+from src.core.install_journal import InstallJournal
+from src.core.download_queue import DownloadQueue
+from src.core.download_engine import MotorDescargas, ControlConcurrencia, DESCARGAS_MIN, DESCARGAS_MAX
 
 # --- CREDENCIALES (SEGURIDAD REFORZADA PARA GITHUB) ---
 # Cargamos desde un archivo externo que está en el .gitignore
@@ -23,9 +33,44 @@ CREDENTIALS_DATA = load_credentials()
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
 CONFIG_FILE = os.path.join(os.getcwd(), 'config', 'launcher_config.json')
 MASTER_DATA = os.path.join(os.getcwd(), 'data', 'master_songs.json')
+MASTER_BIN = os.path.join(os.getcwd(), 'data', manifest_bin.NOMBRE_BIN) # Formato binario para mmap
+MASTER_BIN_NUEVO = os.path.join(os.getcwd(), 'data', 'master_songs.nuevo.bin') # Versión descargada a la espera de reemplazar a la mapeada
+MASTER_STAMP = os.path.join(os.getcwd(), 'data', 'master_songs.stamp.json') # md5Checksum/modifiedTime de la copia local
 ID_CARPETA_MAESTRA = '1K4RFF9QN5n0QLDj7RH73xdA5I4IOlrmj'
+BLOQUE_GRUPOS = 64 # Canciones por bloque de stat + comparación vectorizada
 socket.setdefaulttimeout(300)
 
+def _credenciales_servicio():
+    # Usamos from_service_account_info en lugar de _file
+    def crear():
+        return service_account.Credentials.from_service_account_info(CREDENTIALS_DATA, scopes=SCOPES)
+    # Un solo token para todos los hilos, persistido en data/token_cache.json
+    return TokenCompartido(crear, CREDENTIALS_DATA.get('client_email'))
+
+SERVICIOS = ServicePool(_credenciales_servicio) # Un servicio por hilo para toda la sesión
+LIMITADOR = LimitadorBanda() # Tope de ancho de banda compartido por todas las descargas
+_journal = None
+_journal_lock = threading.Lock()
+
+def journal_instalacion():
+    """Journal de descargas en curso (data/install_journal.db), uno por proceso."""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = InstallJournal()
+        return _journal
+
+_cola = None
+_cola_lock = threading.Lock()
+
+def cola_descargas():
+    """Cola persistente de la última selección (data/download_queue.db), una por proceso."""
+    global _cola
+    with _cola_lock:
+        if _cola is None:
+            _cola = DownloadQueue()
+        return _cola
+
 class DriveManager:
     def guardar_config(self, clave, valor):
         config = {}
@@ -44,34 +89,116 @@ class DriveManager:
         return None
 
     def obtener_servicio(self):
-        # Usamos from_service_account_info en lugar de _file
-        creds = service_account.Credentials.from_service_account_info(CREDENTIALS_DATA, scopes=SCOPES)
-        return build('drive', 'v3', credentials=creds)
-
-    def descargar_archivo(self, service, file_id, ruta_destino):
-        os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
-        request = service.files().get_media(fileId=file_id)
-        fh = io.FileIO(ruta_destino, 'wb')
-        downloader = MediaIoBaseDownload(fh, request, chunksize=5*1024*1024)
-        done = False
-        while not done:
-            _, done = downloader.next_chunk()
-
-    def load_cache(self):
-        if os.path.exists('data/local_cache.json'):
+        # Reutiliza el servicio del hilo actual (credenciales y discovery compartidos)
+        return SERVICIOS.servicio()
+
+    def descargar_archivo(self, service, file_id, ruta_destino, hash_esperado=None, cache=None, tamano_esperado=None, **callbacks):
+        """
+        Descarga reanudable a un .part que solo se mueve a ruta_destino (os.replace)
+        después de verificar tamaño y MD5; ruta_destino nunca queda a medias.
+        El MD5 calculado durante la descarga se guarda en la cache con el mtime/size
+        finales (el próximo escaneo no relee el archivo). Mientras dura, la descarga
+        queda anotada en el journal para recuperarla tras un cierre inesperado.
+        """
+        callbacks.setdefault('limitador', self.limitador_banda())
+        journal = journal_instalacion()
+        journal.iniciar(ruta_destino, file_id, hash_esperado, int(tamano_esperado) if tamano_esperado else None)
+        try:
+            md5_val = transfer.descargar_reanudable(service, file_id, ruta_destino, hash_esperado=hash_esperado,
+                                                    tamano_esperado=tamano_esperado, **callbacks)
+            if cache is not None:
+                stat = os.stat(ruta_destino)
+                self._guardar_en_cache(ruta_destino, stat.st_mtime, stat.st_size, md5_val, cache)
+        finally:
+            # Un .part que queda (corte, cancelación) mantiene la entrada para reanudarlo
+            if not os.path.exists(transfer.ruta_parcial(ruta_destino)):
+                journal.terminar(ruta_destino)
+        return md5_val
+
+    def buscar_local(self, md5_val, excluir=None, cache=None):
+        """Ruta de un archivo local con ese MD5 (según la cache y sin cambios desde entonces), o None."""
+        if cache is None or not md5_val:
+            return None
+        excluir = os.path.normcase(os.path.abspath(excluir)) if excluir else None
+        for ruta, mtime, size in cache.buscar_md5(md5_val):
+            if os.path.normcase(os.path.abspath(ruta)) == excluir:
+                continue
             try:
-                with open('data/local_cache.json', 'r') as f:
-                    return json.load(f)
-            except: return {}
-        return {}
+                stat = os.stat(ruta)
+            except OSError:
+                continue
+            if stat.st_mtime == mtime and stat.st_size == size:
+                return ruta
+        return None
+
+    def instalar_copia(self, origen, ruta_destino, md5_val, cache=None, file_id=None):
+        """
+        Instala un archivo idéntico que ya está en disco (hardlink o copia) en
+        lugar de descargarlo otra vez, y lo registra en la cache. Queda anotado
+        en el journal mientras dura (un .copia huérfano se borra al arrancar).
+        """
+        # song.ini lo reescriben los editores de charts: cada canción tiene su propia copia
+        enlazar = not ruta_destino.lower().endswith('.ini')
+        journal = journal_instalacion()
+        journal.iniciar(ruta_destino, file_id or '', md5_val)
+        try:
+            transfer.instalar_copia(origen, ruta_destino, enlazar)
+        finally:
+            journal.terminar(ruta_destino)
+        if cache is not None:
+            stat = os.stat(ruta_destino)
+            self._guardar_en_cache(ruta_destino, stat.st_mtime, stat.st_size, md5_val, cache)
+
+    def recuperar_descargas(self):
+        """
+        Repasa el journal al arrancar: registra en la cache lo que alcanzó a
+        instalarse, recorta los .part reanudables y borra el resto.
+        Retorna (instalados, reanudables).
+        """
+        cache = self.load_cache()
+        try:
+            return journal_instalacion().reproducir(cache)
+        finally:
+            self.save_cache(cache)
+
+    def limitador_banda(self):
+        """
+        Limitador global según launcher_config.json:
+        'limite_descarga_kb_s' (KB/s, 0 = sin límite) y 'limite_descarga_horario'
+        (p. ej. [{"desde": "23:00", "hasta": "07:00", "kb_s": 0}] para liberar la noche).
+        """
+        LIMITADOR.configurar(self.obtener_config('limite_descarga_kb_s'), self.obtener_config('limite_descarga_horario'))
+        return LIMITADOR
+
+    def load_cache(self, rs=None):
+        """Abre la cache de hashes (data/local_cache.db) indexada por ruta relativa a Songs."""
+        try:
+            return HashStore(raiz=rs or self.obtener_config('ruta_songs'))
+        except Exception as e:
+            print(f"[WAR] Cache de hashes no disponible: {e}")
+            return None
 
-    def save_cache(self, cache):
+    def save_cache(self, cache, prune=False):
+        """Confirma las entradas nuevas; con prune=True borra las rutas que ya no se vieron."""
+        if cache is None: return
         try:
-            os.makedirs('data', exist_ok=True)
-            with open('data/local_cache.json', 'w') as f:
-                json.dump(cache, f)
+            if prune:
+                cache.prune()
+            cache.close()
         except: pass
 
+    def _hash_en_cache(self, ruta_archivo, mtime, size, cache):
+        if cache is not None:
+            entry = cache.get(ruta_archivo)
+            # Si la fecha de modificación y el tamaño son idénticos, el hash es el mismo
+            if entry and entry.get('mtime') == mtime and entry.get('size') == size:
+                return entry.get('md5')
+        return None
+
+    def _guardar_en_cache(self, ruta_archivo, mtime, size, md5_val, cache):
+        if cache is not None and md5_val:
+            cache.put(ruta_archivo, mtime, size, md5_val)
+
     def get_file_hash(self, ruta_archivo, cache=None):
         """Calcula MD5 usando cache si el archivo no ha sido modificado."""
         try:
@@ -82,46 +209,315 @@ class DriveManager:
             return None
 
         # 1. Check Cache
-        if cache is not None and ruta_archivo in cache:
-            entry = cache[ruta_archivo]
-            # Si la fecha de modificación y el tamaño son idénticos, el hash es el mismo
-            if entry.get('mtime') == mtime and entry.get('size') == size:
-                return entry.get('md5')
+        md5_val = self._hash_en_cache(ruta_archivo, mtime, size, cache)
+        if md5_val:
+            return md5_val
 
         # 2. Calculate MD5 (Slow)
-        hash_md5 = hashlib.md5()
+        md5_val = calcular_md5(ruta_archivo)
+
+        # 3. Update Cache
+        self._guardar_en_cache(ruta_archivo, mtime, size, md5_val, cache)
+        return md5_val
+
+    def crear_hash_engine(self):
+        """Motor de hashing según 'hash_workers' y 'hash_modo' de launcher_config.json."""
+        workers = self.obtener_config('hash_workers')
+        modo = self.obtener_config('hash_modo') or 'hilos'
+        return HashEngine(workers=workers, usar_procesos=(modo == 'procesos'))
+
+    def crear_motor_descargas(self, cache=None, cola=None):
+        """Motor de descargas con los límites 'descargas_min' / 'descargas_max' de launcher_config.json."""
+        minimo = self.obtener_config('descargas_min') or DESCARGAS_MIN
+        maximo = self.obtener_config('descargas_max') or DESCARGAS_MAX
+        return MotorDescargas(self, ControlConcurrencia(minimo=minimo, maximo=maximo), cache=cache, cola=cola)
+
+    def _verificar_fila(self, manifiesto, i, stat, faltante, distinto, rs, cache, snapshot, log_callback=None):
+        """
+        Primera pasada sobre la fila i del maestro, con el stat y las máscaras
+        de tamaño ya calculadas. Retorna True (descargar), False (al día) o
+        (ruta_final, clave, stat) cuando hace falta calcular el MD5 local.
+        """
+        ruta_relativa = manifiesto.carpetas_norm[manifiesto.carpeta_idx[i]]
+        nombre = manifiesto.nombres[i]
+        clave = clave_archivo(ruta_relativa, nombre)
+
+        if faltante:
+            if snapshot: snapshot.invalidar(clave)
+            return True
+
+        md5_remoto = manifiesto.hash_hex(i)
+        size_remoto = int(manifiesto.tamanos[i])
+        ruta_final = os.path.join(rs, ruta_relativa, nombre)
+
+        # Sin cambios en el maestro ni en disco desde la última verificación
+        if snapshot and snapshot.vigente(clave, md5_remoto, size_remoto, stat):
+            if cache is not None: cache.marcar_visto(ruta_final)
+            return False
+
+        if distinto:
+            if log_callback: log_callback(f"CAMBIO TAMAÑO: {nombre}")
+            if snapshot: snapshot.invalidar(clave)
+            return True
+
+        if not md5_remoto:
+            if snapshot: snapshot.sellar(clave, md5_remoto, size_remoto, stat)
+            return False
+
+        md5_local = self._hash_en_cache(ruta_final, stat.st_mtime, stat.st_size, cache)
+        if not md5_local:
+            return (ruta_final, clave, stat)
+        return self._resolver_hash(md5_remoto, md5_local, clave, stat, snapshot)
+
+    def _resolver_hash(self, md5_remoto, md5_local, clave, stat, snapshot):
+        descargar = md5_local != md5_remoto
+        if snapshot:
+            if descargar: snapshot.invalidar(clave)
+            else: snapshot.sellar(clave, md5_remoto, stat.st_size, stat)
+        return descargar
+
+    def _item_pendiente(self, manifiesto, i, rs, local_exists):
+        """Materializa una fila pendiente como el dict que consumen las interfaces y la descarga."""
+        item = manifiesto.item(i)
+        item['ruta_final'] = os.path.join(rs, manifiesto.carpetas_norm[manifiesto.carpeta_idx[i]], item['nombre'])
+        item['local_exists'] = local_exists # Flag for UI
+        return item
+
+    def iterar_pendientes(self, manifiesto, rs, cache=None, log_callback=None, progress_callback=None, stat_index=None, snapshot=None):
+        """
+        Compara el maestro (ManifestIndex o lista 'archivos') con la carpeta Songs
+        y genera (ruta_relativa, [items pendientes]) a medida que cada canción queda resuelta.
+
+        Las canciones se procesan en bloques: los tamaños locales salen de un
+        StatIndex (un scandir por carpeta) y se comparan contra el maestro en una
+        sola pasada vectorizada. Las entradas que no cambiaron desde la última
+        verificación (SyncSnapshot) se confirman solo con el stat; el resto pasa
+        por la cache de hashes y los MD5 faltantes se calculan en paralelo con el
+        HashEngine mientras el escaneo sigue avanzando.
+        """
+        if not isinstance(manifiesto, ManifestIndex):
+            manifiesto = ManifestIndex.desde_archivos(manifiesto)
+        if stat_index is None:
+            stat_index = StatIndex(rs)
+        propio_snapshot = snapshot is None
+        if propio_snapshot:
+            try:
+                snapshot = SyncSnapshot(rs)
+            except Exception as e:
+                print(f"[WAR] Snapshot de verificación no disponible: {e}")
+
+        total = len(manifiesto)
+        n_grupos = len(manifiesto.carpetas)
+        limites = manifiesto.grupo_limites
+        abiertos = {}  # g -> [[(fila, local_exists)], hashes faltantes]
+        en_hash = {}   # fila -> (g, clave, stat)
+        hechos = 0
+        completo = False
+
+        def armar_grupo(g, filas):
+            filas.sort()
+            return manifiesto.carpetas[g], [self._item_pendiente(manifiesto, i, rs, existe) for i, existe in filas]
+
+        def cerrar_hashes(resultados):
+            for i, md5_local in resultados:
+                g, clave, stat = en_hash.pop(i)
+                ruta_final = os.path.join(rs, manifiesto.carpetas_norm[g], manifiesto.nombres[i])
+                self._guardar_en_cache(ruta_final, stat.st_mtime, stat.st_size, md5_local, cache)
+                grupo = abiertos[g]
+                if self._resolver_hash(manifiesto.hash_hex(i), md5_local, clave, stat, snapshot):
+                    grupo[0].append((i, True))
+                grupo[1] -= 1
+                if grupo[1] == 0:
+                    del abiertos[g]
+                    if grupo[0]:
+                        yield armar_grupo(g, grupo[0])
+
+        engine = self.crear_hash_engine()
         try:
-            with open(ruta_archivo, "rb") as f:
-                for chunk in iter(lambda: f.read(65536), b""):
-                    hash_md5.update(chunk)
-            md5_val = hash_md5.hexdigest()
-            
-            # 3. Update Cache
-            if cache is not None:
-                cache[ruta_archivo] = {
-                    'mtime': mtime,
-                    'size': size,
-                    'md5': md5_val
-                }
-            return md5_val
-        except FileNotFoundError:
-            return None
+            with engine:
+                for g0 in range(0, n_grupos, BLOQUE_GRUPOS):
+                    g1 = min(g0 + BLOQUE_GRUPOS, n_grupos)
+                    filas = manifiesto.grupo_orden[limites[g0]:limites[g1]]
+
+                    # Stat del bloque + comparación de tamaños vectorizada
+                    locales, stats = manifiesto.tamanos_locales(filas, stat_index)
+                    faltantes, distintos = manifiesto.comparar_tamanos(filas, locales)
+
+                    pos = 0
+                    for g in range(g0, g1):
+                        fin = pos + int(limites[g + 1] - limites[g])
+                        pendientes = []
+                        faltan = 0
+                        for k in range(pos, fin):
+                            i = int(filas[k])
+                            estado = self._verificar_fila(manifiesto, i, stats[k], faltantes[k], distintos[k],
+                                                          rs, cache, snapshot, log_callback)
+                            if estado is True:
+                                pendientes.append((i, not faltantes[k]))
+                            elif estado is not False:
+                                ruta_final, clave, stat = estado
+                                en_hash[i] = (g, clave, stat)
+                                engine.enviar(i, ruta_final)
+                                faltan += 1
+                        pos = fin
+
+                        if faltan:
+                            abiertos[g] = [pendientes, faltan]
+                        elif pendientes:
+                            yield armar_grupo(g, pendientes)
+
+                        # Entregar las canciones cuyos hashes ya terminaron
+                        yield from cerrar_hashes(engine.resultados())
+
+                    hechos += len(filas)
+                    if progress_callback:
+                        progress_callback(hechos, total)
+
+                if en_hash:
+                    if log_callback: log_callback(f"Calculando {len(en_hash)} hashes...")
+                    yield from cerrar_hashes(engine.resultados(esperar=True))
+            completo = True
+        finally:
+            if snapshot:
+                try:
+                    snapshot.guardar(completo=completo)
+                except Exception as e:
+                    print(f"[WAR] No se pudo guardar el snapshot: {e}")
+                if propio_snapshot:
+                    snapshot.close()
+
+    def comparar_biblioteca(self, manifiesto, rs, cache=None, log_callback=None, progress_callback=None, stat_index=None, snapshot=None):
+        """Versión no incremental de iterar_pendientes: retorna {ruta_relativa: [items pendientes]}."""
+        descargas_pendientes = {}
+        for group_key, files in self.iterar_pendientes(manifiesto, rs, cache, log_callback, progress_callback, stat_index, snapshot):
+            descargas_pendientes[group_key] = files
+        return descargas_pendientes
+
+    def ruta_manifiesto(self):
+        """Copia local del maestro a usar: el binario si existe, si no el JSON (o None)."""
+        if not self._aplicar_master_nuevo():
+            return MASTER_BIN_NUEVO
+        for ruta in (MASTER_BIN, MASTER_DATA):
+            if os.path.exists(ruta):
+                return ruta
+        return None
+
+    def cargar_manifiesto(self, master_path=None):
+        """ManifestIndex del maestro local (se reutiliza mientras el archivo no cambie)."""
+        master_path = master_path or self.ruta_manifiesto()
+        if not master_path:
+            raise FileNotFoundError("No hay master_songs.json ni master_songs.bin en data/")
+        return ManifestIndex.cargar(master_path)
 
     # Deprecated compatibility wrapper
     def calcular_md5(self, ruta_archivo):
         return self.get_file_hash(ruta_archivo)
 
+    def _leer_sellos_master(self):
+        """{nombre en Drive: sello} de las copias locales del maestro."""
+        if os.path.exists(MASTER_STAMP):
+            try:
+                with open(MASTER_STAMP, 'r') as f: sellos = json.load(f)
+                # Formato anterior: un solo sello para master_songs.json
+                if 'id' in sellos: sellos = {'master_songs.json': sellos}
+                return sellos
+            except: return {}
+        return {}
+
+    def _guardar_sello_master(self, remoto, ruta_local):
+        st = os.stat(ruta_local)
+        sellos = self._leer_sellos_master()
+        sellos[remoto.get('name', 'master_songs.json')] = {
+            'id': remoto.get('id'),
+            'md5Checksum': remoto.get('md5Checksum'),
+            'modifiedTime': remoto.get('modifiedTime'),
+            'size': st.st_size,
+            'mtime': st.st_mtime
+        }
+        try:
+            with open(MASTER_STAMP, 'w') as f: json.dump(sellos, f, indent=4)
+        except: pass
+
+    def master_sin_cambios(self, remoto, ruta_local="data/master_songs.json"):
+        """True si la copia local corresponde a la versión remota (md5Checksum/modifiedTime) y no fue tocada."""
+        sello = self._leer_sellos_master().get(remoto.get('name', 'master_songs.json'))
+        if not sello or not os.path.exists(ruta_local):
+            return False
+        if sello.get('id') != remoto.get('id'):
+            return False
+        if remoto.get('md5Checksum'):
+            if sello.get('md5Checksum') != remoto.get('md5Checksum'): return False
+        elif sello.get('modifiedTime') != remoto.get('modifiedTime'):
+            return False
+        st = os.stat(ruta_local)
+        return sello.get('size') == st.st_size and sello.get('mtime') == st.st_mtime
+
+    def _aplicar_master_nuevo(self):
+        """
+        Reemplaza master_songs.bin por master_songs.nuevo.bin si hay uno pendiente.
+        En Windows no se puede reemplazar un archivo mapeado: si un índice todavía
+        usa el anterior, retorna False y el cambio queda para el próximo arranque.
+        """
+        if not os.path.exists(MASTER_BIN_NUEVO):
+            return True
+        ManifestIndex.liberar(MASTER_BIN) # Sin la referencia de la cache, el mmap se cierra al soltar el índice
+        try:
+            os.replace(MASTER_BIN_NUEVO, MASTER_BIN)
+        except PermissionError:
+            return False
+        return True
+
+    def _actualizar_master_binario(self, service, remoto):
+        """Descarga master_songs.bin.z y lo deja descomprimido en data/ para leerlo con mmap."""
+        self._aplicar_master_nuevo()
+        if self.master_sin_cambios(remoto, MASTER_BIN):
+            print("master_songs.bin sin cambios, se usa la copia local.")
+            return True
+        print("Descargando master_songs.bin actualizado...")
+        ruta_z = MASTER_BIN + '.z'
+        self.descargar_archivo(service, remoto['id'], ruta_z, hash_esperado=remoto.get('md5Checksum'))
+        # Se descomprime con otro nombre: el binario actual puede seguir mapeado por un índice en uso
+        manifest_bin.descomprimir(ruta_z, MASTER_BIN_NUEVO)
+        os.remove(ruta_z)
+        self._guardar_sello_master(remoto, MASTER_BIN_NUEVO) # os.replace conserva tamaño y mtime
+        if not self._aplicar_master_nuevo():
+            print("[WAR] master_songs.bin sigue en uso; la versión nueva se aplicará al reiniciar.")
+        return True
+
     def actualizar_master(self, service):
-        """Busca y descarga la última versión de master_songs.json."""
+        """
+        Busca la última versión del maestro y la descarga solo si cambió en Drive.
+        Prefiere el formato binario comprimido (master_songs.bin.z) y usa
+        master_songs.json si no está publicado o falla.
+        """
         try:
-            query = f"'{ID_CARPETA_MAESTRA}' in parents and name = 'master_songs.json' and trashed = false"
-            results = service.files().list(q=query, fields="files(id, name)").execute()
-            items = results.get('files', [])
-            
-            if items:
-                file_id = items[0]['id']
+            query = (f"'{ID_CARPETA_MAESTRA}' in parents and trashed = false and "
+                     f"(name = '{manifest_bin.NOMBRE_COMPRIMIDO}' or name = 'master_songs.json')")
+            results = service.files().list(q=query, fields="files(id, name, md5Checksum, modifiedTime)").execute()
+            items = {item['name']: item for item in results.get('files', [])}
+
+            if manifest_bin.NOMBRE_COMPRIMIDO in items:
+                try:
+                    return self._actualizar_master_binario(service, items[manifest_bin.NOMBRE_COMPRIMIDO])
+                except Exception as e:
+                    print(f"[WAR] Maestro binario no disponible, usando JSON: {e}")
+
+            if 'master_songs.json' in items:
+                remoto = items['master_songs.json']
+                # Si había un binario viejo, deja de ser la copia preferida
+                for ruta in (MASTER_BIN_NUEVO, MASTER_BIN):
+                    if os.path.exists(ruta):
+                        ManifestIndex.liberar(ruta)
+                        try:
+                            os.remove(ruta)
+                        except PermissionError:
+                            print(f"[WAR] No se pudo borrar {os.path.basename(ruta)} (en uso); se quitará al reiniciar.")
+                if self.master_sin_cambios(remoto):
+                    print("master_songs.json sin cambios, se usa la copia local.")
+                    return True
                 print("Descargando master_songs.json actualizado...")
-                self.descargar_archivo(service, file_id, "data/master_songs.json")
+                self.descargar_archivo(service, remoto['id'], "data/master_songs.json", hash_esperado=remoto.get('md5Checksum'))
+                self._guardar_sello_master(remoto, "data/master_songs.json")
                 return True
             else:
                 print("[WAR] No se encontró master_songs.json en el servidor.")
@@ -137,16 +533,9 @@ class DriveManager:
             items = results.get('files', [])
             if items:
                 file_id = items[0]['id']
-                # Descargar en memoria
-                request = service.files().get_media(fileId=file_id)
-                fh = io.BytesIO()
-                downloader = MediaIoBaseDownload(fh, request)
-                done = False
-                while not done:
-                    _, done = downloader.next_chunk()
-                
-                fh.seek(0)
-                return json.loads(fh.read().decode('utf-8'))
+                # Archivo de pocos bytes: una sola petición, sin Range ni bucle de tramos
+                contenido = service.files().get_media(fileId=file_id).execute()
+                return json.loads(contenido.decode('utf-8'))
         except Exception as e:
             print(f"Error obteniendo version remota: {e}")
         return None
@@ -175,7 +564,31 @@ class DriveManager:
                 break
         return rutas_detectadas
 
-    def verificar_actualizaciones(self, service, log_callback=None):
+    def armar_lista_ui(self, descargas_pendientes, rs, stat_index=None):
+        """
+        Convierte {ruta_relativa: [items]} en la lista que muestran las interfaces.
+        Format: [{'name': 'Song Name', 'full_path': ..., 'files': [item1, item2], 'status': 'UPDATE'}]
+        """
+        if stat_index is None:
+            stat_index = StatIndex(rs)
+        ui_data = []
+        for folder_path, files in descargas_pendientes.items():
+            # Folder path usually is "Artist\Album\Song" or just "Song"
+            display_name = folder_path.replace('\\', '/').split('/')[-1]
+            if not display_name: display_name = folder_path # Fallback
+
+            # Simple rule: if folder exists locally, it's UPDATE, else NEW
+            status = "UPDATE" if stat_index.existe_carpeta(folder_path) else "NUEVA"
+
+            ui_data.append({
+                'name': display_name,
+                'full_path': folder_path,
+                'files': files,
+                'status': status
+            })
+        return ui_data
+
+    def verificar_actualizaciones(self, service, log_callback=None, stat_index=None):
         """
         Escanea master_songs.json y compara con la biblioteca local.
         Retorna un diccionario de canciones pendientes de descarga.
@@ -187,72 +600,31 @@ class DriveManager:
             return {}
 
         # 1. Cargar master_songs.json
-        master_path = "data/master_songs.json"
-        if not os.path.exists(master_path):
+        master_path = self.ruta_manifiesto()
+        if not master_path:
             if log_callback: log_callback("Actualizando datos del maestro...")
             self.actualizar_master(service)
+            master_path = self.ruta_manifiesto()
         
-        if not os.path.exists(master_path):
+        if not master_path:
             if log_callback: log_callback("[ERR] No se pudo obtener el maestro.")
             return {}
 
         try:
-            with open(master_path, 'r', encoding='utf-8') as f:
-                servidor = json.load(f)
-        except: 
+            manifiesto = self.cargar_manifiesto(master_path)
+        except Exception:
             if log_callback: log_callback("[ERR] Error al leer el maestro.")
             return {}
 
         if log_callback: log_callback("Comparando con colección local...")
         # 2. Cargar Cache Local
-        local_cache = self.load_cache()
-        
-        descargas_pendientes = {}
-        
+        local_cache = self.load_cache(rs)
+
         # 3. Comparar
-        archivos_servidor = servidor.get('archivos', servidor)
-        if not isinstance(archivos_servidor, list):
-             print("[ERR] master_songs.json is not a valid list of files.")
-             return {}
-
-        total = len(archivos_servidor)
-        for i, item in enumerate(archivos_servidor):
-            if not isinstance(item, dict): continue
-            
-            if i % 50 == 0 and log_callback:
-                log_callback(f"Verificando {i}/{total} archivos...")
+        def progreso(i, total):
+            if log_callback: log_callback(f"Verificando {i}/{total} archivos...")
 
-            ruta_relativa = item.get('ruta_relativa', '').replace('\\', '/')
-            ruta_final = os.path.join(rs, ruta_relativa, item['nombre'])
-            
-            descargar = False
-            
-            if not os.path.exists(ruta_final):
-                descargar = True
-            else:
-                try:
-                    size_local = os.path.getsize(ruta_final)
-                    size_remoto = int(item.get('tamano', 0))
-                    
-                    if size_local != size_remoto:
-                        descargar = True
-                    else:
-                        md5_local = self.get_file_hash(ruta_final, cache=local_cache)
-                        md5_remoto = item.get('hash')
-                        if md5_remoto and md5_local != md5_remoto:
-                            descargar = True
-                except:
-                    descargar = True
-            
-            if descargar:
-                item['ruta_final'] = ruta_final 
-                if 'id_drive' not in item:
-                    item['id_drive'] = item.get('id')
-                
-                group_key = item['ruta_relativa']
-                if group_key not in descargas_pendientes:
-                    descargas_pendientes[group_key] = []
-                descargas_pendientes[group_key].append(item)
-
-        self.save_cache(local_cache)
-        return descargas_pendientes
\ No newline at end of file
+        descargas_pendientes = self.comparar_biblioteca(manifiesto, rs, cache=local_cache, progress_callback=progreso, stat_index=stat_index)
+
+        self.save_cache(local_cache, prune=True)
+        return descargas_pendientes
@@ -0,0 +1,80 @@
+import os
+import json
+import threading
+import httplib2
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient import discovery_cache
+
+# Documento de descubrimiento del API de Drive guardado en disco: construir un
+# servicio desde el dict ya parseado cuesta microsegundos en lugar de releer y
+# parsear ~200 KB de JSON en cada build().
+DISCOVERY_CACHE = os.path.join('data', 'drive_v3_discovery.json')
+# Permite apuntar a un servidor local que imite el API de Drive (pruebas, sin autenticación)
+API_ENDPOINT = os.environ.get('DRIVE_API_ENDPOINT')
+
+_doc_lock = threading.Lock()
+_documento = None
+
+
+def documento_discovery(ruta=DISCOVERY_CACHE):
+    """Documento de Drive v3 parseado, una sola vez por proceso."""
+    global _documento
+    with _doc_lock:
+        if _documento is not None:
+            return _documento
+        doc = None
+        if os.path.exists(ruta):
+            try:
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    doc = json.load(f)
+            except (OSError, ValueError):
+                doc = None
+        if doc is None:
+            # Copia incluida en google-api-python-client (sin red)
+            texto = discovery_cache.get_static_doc('drive', 'v3')
+            if texto:
+                doc = json.loads(texto)
+                try:
+                    os.makedirs(os.path.dirname(ruta) or '.', exist_ok=True)
+                    with open(ruta, 'w', encoding='utf-8') as f:
+                        f.write(texto)
+                except OSError:
+                    pass
+        _documento = doc
+        return doc
+
+
+def construir_servicio(credentials=None):
+    """Crea un servicio de Drive v3 con el documento cacheado (cada uno con su propio transporte)."""
+    if API_ENDPOINT:
+        return build('drive', 'v3', http=httplib2.Http(), client_options={'api_endpoint': API_ENDPOINT})
+    doc = documento_discovery()
+    if doc is None:
+        return build('drive', 'v3', credentials=credentials)
+    return build_from_document(doc, credentials=credentials)
+
+
+class ServicePool:
+    """
+    Un servicio de Drive por hilo, reutilizado durante toda la sesión.
+    httplib2 no es thread-safe, así que cada hilo recibe su propio transporte;
+    las credenciales y el documento de descubrimiento se comparten.
+    """
+
+    def __init__(self, crear_credenciales):
+        self._crear_credenciales = crear_credenciales
+        self._credenciales = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def credenciales(self):
+        with self._lock:
+            if self._credenciales is None and not API_ENDPOINT:
+                self._credenciales = self._crear_credenciales()
+            return self._credenciales
+
+    def servicio(self):
+        service = getattr(self._local, 'service', None)
+        if service is None:
+            service = self._local.service = construir_servicio(self.credenciales())
+        return service
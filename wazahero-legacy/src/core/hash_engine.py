@@ -0,0 +1,82 @@
+import os
+import hashlib
+import concurrent.futures
+
+# Tamaño de lectura para el MD5 (1 MB rinde mejor que 64 KB en discos grandes)
+BLOQUE_LECTURA = 1024 * 1024
+MAX_WORKERS_POR_DEFECTO = 8
+
+
+def calcular_md5(ruta_archivo):
+    """Calcula el MD5 de un archivo completo. Devuelve None si no existe."""
+    hash_md5 = hashlib.md5()
+    try:
+        with open(ruta_archivo, "rb") as f:
+            for chunk in iter(lambda: f.read(BLOQUE_LECTURA), b""):
+                hash_md5.update(chunk)
+    except FileNotFoundError:
+        return None
+    return hash_md5.hexdigest()
+
+
+def workers_por_defecto():
+    # hashlib libera el GIL, así que los hilos escalan con núcleos y discos
+    return max(1, min(MAX_WORKERS_POR_DEFECTO, os.cpu_count() or 1))
+
+
+class HashEngine:
+    """
+    Ejecuta los cálculos de MD5 que no están en cache sobre un pool de hilos
+    (o de procesos) y devuelve los resultados a medida que terminan.
+
+    Uso incremental:
+        with engine:
+            engine.enviar(clave, ruta)
+            for clave, md5 in engine.resultados(): ...          # solo los terminados
+            for clave, md5 in engine.resultados(esperar=True): ... # todos
+    """
+
+    def __init__(self, workers=None, usar_procesos=False):
+        self.workers = int(workers) if workers else workers_por_defecto()
+        self.usar_procesos = bool(usar_procesos)
+        self._pool = None
+        self._futures = {}
+
+    def _crear_pool(self):
+        if self.usar_procesos:
+            return concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        return concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hash")
+
+    def __enter__(self):
+        self._futures = {}
+        return self
+
+    def __exit__(self, *exc):
+        # Si el consumidor abandona el escaneo, no seguir hasheando
+        for future in self._futures:
+            future.cancel()
+        self._futures = {}
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        return False
+
+    def enviar(self, clave, ruta_archivo):
+        # El pool se crea recién con el primer archivo: un escaneo sin cambios no lo levanta
+        if self._pool is None:
+            self._pool = self._crear_pool()
+        self._futures[self._pool.submit(calcular_md5, ruta_archivo)] = clave
+
+    def resultados(self, esperar=False):
+        """Genera (clave, md5) de los cálculos terminados; con esperar=True, de todos."""
+        if esperar:
+            terminados = concurrent.futures.as_completed(list(self._futures))
+        else:
+            terminados = [f for f in list(self._futures) if f.done()]
+        for future in terminados:
+            clave = self._futures.pop(future)
+            try:
+                md5_val = future.result()
+            except OSError:
+                md5_val = None
+            yield clave, md5_val
@@ -0,0 +1,134 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+HASH_DB = os.path.join('data', 'local_cache.db')
+LEGACY_CACHE = os.path.join('data', 'local_cache.json')
+COMMIT_CADA = 500        # put() sin confirmar antes de hacer commit
+COMMIT_SEGUNDOS = 5.0    # ... o tiempo máximo desde el último commit
+
+
+class HashStore:
+    """
+    Cache de hashes MD5 en SQLite, indexada por ruta relativa a la carpeta Songs.
+    Cada entrada se lee y se escribe por separado (upsert), así que abrir y
+    guardar no depende del tamaño de la biblioteca.
+    """
+
+    def __init__(self, ruta_db=HASH_DB, raiz=None):
+        self.ruta_db = ruta_db
+        self.raiz = os.path.abspath(raiz) if raiz else None
+        self._lock = threading.Lock()
+        self._vistos = set()
+        self._sin_commit = 0
+        self._ultimo_commit = time.monotonic()
+        os.makedirs(os.path.dirname(ruta_db) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(ruta_db, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            " ruta TEXT PRIMARY KEY,"
+            " mtime REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " md5 TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS hashes_md5 ON hashes (md5)")
+        self._conn.commit()
+        self._migrar_json()
+
+    def clave(self, ruta_archivo):
+        """Convierte una ruta absoluta en la clave relativa ('Artista/Canción/notes.chart')."""
+        if self.raiz:
+            ruta_abs = os.path.abspath(ruta_archivo)
+            try:
+                rel = os.path.relpath(ruta_abs, self.raiz)
+            except ValueError: # Otra unidad en Windows
+                rel = None
+            if rel and not rel.startswith('..'):
+                return rel.replace('\\', '/')
+        return ruta_archivo.replace('\\', '/')
+
+    def get(self, ruta_archivo):
+        """Devuelve {'mtime', 'size', 'md5'} o None."""
+        k = self.clave(ruta_archivo)
+        with self._lock:
+            self._vistos.add(k)
+            row = self._conn.execute("SELECT mtime, size, md5 FROM hashes WHERE ruta = ?", (k,)).fetchone()
+        if row:
+            return {'mtime': row[0], 'size': row[1], 'md5': row[2]}
+        return None
+
+    def ruta_absoluta(self, clave):
+        return os.path.join(self.raiz, clave) if self.raiz else clave
+
+    def buscar_md5(self, md5_val):
+        """Archivos locales con ese contenido: lista de (ruta absoluta, mtime, size)."""
+        with self._lock:
+            filas = self._conn.execute("SELECT ruta, mtime, size FROM hashes WHERE md5 = ?", (md5_val,)).fetchall()
+        return [(self.ruta_absoluta(k), mtime, size) for k, mtime, size in filas]
+
+    def marcar_visto(self, ruta_archivo):
+        """Conserva la entrada en el próximo prune() sin consultarla."""
+        k = self.clave(ruta_archivo)
+        with self._lock:
+            self._vistos.add(k)
+
+    def put(self, ruta_archivo, mtime, size, md5_val):
+        k = self.clave(ruta_archivo)
+        with self._lock:
+            self._vistos.add(k)
+            self._conn.execute(
+                "INSERT INTO hashes (ruta, mtime, size, md5) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(ruta) DO UPDATE SET mtime = excluded.mtime, size = excluded.size, md5 = excluded.md5",
+                (k, mtime, size, md5_val)
+            )
+            # Commit por lotes: un cierre inesperado pierde como mucho el último lote
+            self._sin_commit += 1
+            if self._sin_commit >= COMMIT_CADA or time.monotonic() - self._ultimo_commit >= COMMIT_SEGUNDOS:
+                self._commit()
+
+    def prune(self):
+        """Elimina las entradas que no se consultaron en este escaneo (archivos borrados o fuera del maestro)."""
+        with self._lock:
+            cur = self._conn.cursor()
+            cur.execute("CREATE TEMP TABLE IF NOT EXISTS vistos (ruta TEXT PRIMARY KEY)")
+            cur.execute("DELETE FROM vistos")
+            cur.executemany("INSERT OR IGNORE INTO vistos (ruta) VALUES (?)", ((k,) for k in self._vistos))
+            cur.execute("DELETE FROM hashes WHERE ruta NOT IN (SELECT ruta FROM vistos)")
+            borrados = cur.rowcount
+            cur.execute("DELETE FROM vistos")
+            self._commit()
+        return borrados
+
+    def _commit(self):
+        # Llamar con self._lock tomado
+        self._conn.commit()
+        self._sin_commit = 0
+        self._ultimo_commit = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._conn.close()
+
+    def _migrar_json(self):
+        """Importa una sola vez el antiguo data/local_cache.json (claves absolutas)."""
+        legacy = os.path.join(os.path.dirname(self.ruta_db), os.path.basename(LEGACY_CACHE))
+        if not os.path.exists(legacy):
+            return
+        try:
+            with open(legacy, 'r') as f:
+                viejo = json.load(f)
+            filas = []
+            for ruta, entry in viejo.items():
+                if entry.get('md5'):
+                    filas.append((self.clave(ruta), entry.get('mtime', 0), entry.get('size', 0), entry['md5']))
+            with self._lock:
+                self._conn.executemany("INSERT OR IGNORE INTO hashes (ruta, mtime, size, md5) VALUES (?, ?, ?, ?)", filas)
+                self._conn.commit()
+            os.replace(legacy, legacy + '.migrado')
+        except Exception as e:
+            print(f"[WAR] No se pudo migrar {legacy}: {e}")
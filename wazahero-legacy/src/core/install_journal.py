@@ -0,0 +1,100 @@
+import os
+import time
+import sqlite3
+import threading
+
+from src.core import transfer
+
+JOURNAL_DB = os.path.join('data', 'install_journal.db')
+
+
+class InstallJournal:
+    """
+    Registro de las descargas en curso. Cada archivo se anota antes de empezar
+    y se borra cuando quedó instalado (o descartado). Lo que sigue anotado al
+    arrancar es lo que un cierre inesperado dejó a medias: reproducir() lo
+    limpia o lo deja listo para reanudar sin volver a escanear la biblioteca.
+    """
+
+    def __init__(self, ruta_db=JOURNAL_DB):
+        self.ruta_db = ruta_db
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(ruta_db) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(ruta_db, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS en_curso ("
+            " ruta TEXT PRIMARY KEY,"
+            " id_drive TEXT NOT NULL,"
+            " hash TEXT,"
+            " tamano INTEGER,"
+            " inicio REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def iniciar(self, ruta_final, id_drive, hash_esperado=None, tamano=None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO en_curso (ruta, id_drive, hash, tamano, inicio) VALUES (?, ?, ?, ?, ?)",
+                (os.path.abspath(ruta_final), id_drive, hash_esperado, tamano, time.time())
+            )
+            self._conn.commit()
+
+    def terminar(self, ruta_final):
+        with self._lock:
+            self._conn.execute("DELETE FROM en_curso WHERE ruta = ?", (os.path.abspath(ruta_final),))
+            self._conn.commit()
+
+    def entradas(self):
+        with self._lock:
+            filas = self._conn.execute("SELECT ruta, id_drive, hash, tamano, inicio FROM en_curso").fetchall()
+        return [{'ruta': r, 'id_drive': i, 'hash': h, 'tamano': t, 'inicio': ini} for r, i, h, t, ini in filas]
+
+    def reproducir(self, cache=None):
+        """
+        Recorre lo que quedó anotado tras un cierre inesperado:
+        - archivo final presente, sin .part y escrito después de anotar la
+          entrada: se instaló (el MD5 se verifica antes del os.replace) y faltó
+          cerrar la entrada; se registra en la cache. Si es anterior, es la
+          versión vieja de una actualización que no llegó a empezar: no se toca
+          la cache y el próximo escaneo lo vuelve a detectar.
+        - .part con estado válido: se recorta al último offset confirmado y se
+          conserva para reanudar.
+        - cualquier otro resto (.part sin estado, .part.json.tmp, .copia) se borra.
+        Retorna (instalados, reanudables).
+        """
+        instalados = 0
+        reanudables = 0
+        for entrada in self.entradas():
+            ruta = entrada['ruta']
+            parcial = transfer.ruta_parcial(ruta)
+            for temporal in (transfer.ruta_estado(ruta) + '.tmp', ruta + transfer.SUFIJO_COPIA):
+                try:
+                    os.remove(temporal)
+                except OSError:
+                    pass
+
+            if os.path.exists(parcial):
+                offset = transfer.offset_reanudable(ruta, entrada['id_drive'], entrada['hash'])
+                if offset:
+                    with open(parcial, 'r+b') as fh:
+                        fh.truncate(offset) # Lo posterior al offset confirmado no es fiable
+                    reanudables += 1
+                    continue
+                transfer.descartar_parcial(ruta)
+            elif os.path.exists(ruta):
+                try:
+                    os.remove(transfer.ruta_estado(ruta))
+                except OSError:
+                    pass
+                stat = os.stat(ruta)
+                if stat.st_mtime >= entrada['inicio']:
+                    if cache is not None and entrada['hash'] and (entrada['tamano'] is None or entrada['tamano'] == stat.st_size):
+                        cache.put(ruta, stat.st_mtime, stat.st_size, entrada['hash'])
+                    instalados += 1
+            self.terminar(ruta)
+        return instalados, reanudables
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import mmap
+import zlib
+import struct
+import numpy as np
+
+from src.core.manifest_index import ManifestIndex
+
+# Formato binario del maestro (master_songs.bin)
+#
+#   cabecera  '<4sHHQQ'  magic, versión, nº de secciones, nº de archivos, nº de carpetas
+#   tabla     nº de secciones x '<8sQQ'  nombre, offset, longitud
+#   secciones alineadas a 8 bytes, columnas little-endian listas para np.frombuffer
+#
+# En Drive se publica comprimido con zlib (master_songs.bin.z); en disco se guarda
+# descomprimido para leerlo con mmap sin copiar las columnas numéricas.
+MAGIC = b'WZHM'
+VERSION = 1
+CABECERA = struct.Struct('<4sHHQQ')
+ENTRADA = struct.Struct('<8sQQ')
+NOMBRE_BIN = 'master_songs.bin'
+NOMBRE_COMPRIMIDO = 'master_songs.bin.z'
+BLOQUE_ZLIB = 1024 * 1024
+
+
+def _tabla_strings(valores):
+    """Codifica una lista de strings como (offsets uint64[n + 1], blob utf-8)."""
+    codificados = [(v or '').encode('utf-8') for v in valores]
+    offsets = np.zeros(len(codificados) + 1, dtype='<u8')
+    if codificados:
+        np.cumsum([len(c) for c in codificados], out=offsets[1:])
+    return offsets, b''.join(codificados)
+
+
+class TablaStrings:
+    """Lista de strings de solo lectura sobre un blob mapeado; decodifica bajo demanda."""
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        i = int(i)
+        return bytes(self._blob[self._offsets[i]:self._offsets[i + 1]]).decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def escribir(index, ruta):
+    """Guarda un ManifestIndex con el formato binario."""
+    nombres_unicos = []
+    posicion = {}
+    nombre_idx = np.empty(len(index), dtype='<i4')
+    for i, nombre in enumerate(index.nombres):
+        j = posicion.get(nombre)
+        if j is None:
+            j = posicion[nombre] = len(nombres_unicos)
+            nombres_unicos.append(nombre)
+        nombre_idx[i] = j
+
+    carp_off, carp_txt = _tabla_strings(index.carpetas)
+    nom_off, nom_txt = _tabla_strings(nombres_unicos)
+    ids_off, ids_txt = _tabla_strings(index.ids)
+
+    secciones = [
+        (b'tamanos', index.tamanos.astype('<i8').tobytes()),
+        (b'carpidx', index.carpeta_idx.astype('<i4').tobytes()),
+        (b'hashes', np.ascontiguousarray(index.hashes).tobytes()),
+        (b'nomidx', nombre_idx.tobytes()),
+        (b'orden', index.grupo_orden.astype('<i4').tobytes()),
+        (b'limites', index.grupo_limites.astype('<i8').tobytes()),
+        (b'carp_off', carp_off.tobytes()),
+        (b'carp_txt', carp_txt),
+        (b'nom_off', nom_off.tobytes()),
+        (b'nom_txt', nom_txt),
+        (b'ids_off', ids_off.tobytes()),
+        (b'ids_txt', ids_txt),
+        (b'info', json.dumps(index.info, ensure_ascii=False).encode('utf-8')),
+    ]
+
+    offset = CABECERA.size + ENTRADA.size * len(secciones)
+    tabla = []
+    for nombre, datos in secciones:
+        offset += -offset % 8
+        tabla.append((nombre, offset, len(datos)))
+        offset += len(datos)
+
+    tmp = ruta + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(CABECERA.pack(MAGIC, VERSION, len(secciones), len(index), len(index.carpetas)))
+        for nombre, off, largo in tabla:
+            f.write(ENTRADA.pack(nombre, off, largo))
+        for (nombre, off, largo), (_, datos) in zip(tabla, secciones):
+            f.write(b'\x00' * (off - f.tell()))
+            f.write(datos)
+    os.replace(tmp, ruta)
+
+
+def leer(ruta):
+    """Abre master_songs.bin con mmap y devuelve un ManifestIndex sobre las columnas mapeadas."""
+    with open(ruta, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, n_secciones, n, n_carpetas = CABECERA.unpack_from(mm, 0)
+    if magic != MAGIC or version != VERSION:
+        mm.close()
+        raise ValueError(f"{ruta} no es un maestro binario compatible.")
+
+    secciones = {}
+    for k in range(n_secciones):
+        nombre, off, largo = ENTRADA.unpack_from(mm, CABECERA.size + k * ENTRADA.size)
+        secciones[nombre.rstrip(b'\x00').decode('ascii')] = (off, largo)
+
+    def columna(nombre, dtype):
+        off, largo = secciones[nombre]
+        return np.frombuffer(mm, dtype=dtype, count=largo // np.dtype(dtype).itemsize, offset=off)
+
+    def blob(nombre):
+        off, largo = secciones[nombre]
+        return memoryview(mm)[off:off + largo]
+
+    carpetas = list(TablaStrings(columna('carp_off', '<u8'), blob('carp_txt')))
+    nombres_unicos = [sys.intern(s) for s in TablaStrings(columna('nom_off', '<u8'), blob('nom_txt'))]
+    nombre_idx = columna('nomidx', '<i4')
+    nombres = [nombres_unicos[j] for j in nombre_idx.tolist()]
+    ids = TablaStrings(columna('ids_off', '<u8'), blob('ids_txt'))
+    info = json.loads(bytes(blob('info')).decode('utf-8') or '{}')
+
+    index = ManifestIndex(
+        carpetas, columna('carpidx', '<i4'), nombres, ids,
+        columna('hashes', np.uint8), columna('tamanos', '<i8'), info=info,
+        grupo_orden=columna('orden', '<i4'), grupo_limites=columna('limites', '<i8'),
+    )
+    index._mmap = mm # Mantener vivo el mapeo mientras exista el índice
+    return index
+
+
+def comprimir(ruta_bin, ruta_z):
+    """Versión para publicar en Drive (zlib, nivel 9)."""
+    comp = zlib.compressobj(9)
+    with open(ruta_bin, 'rb') as src, open(ruta_z, 'wb') as dst:
+        for chunk in iter(lambda: src.read(BLOQUE_ZLIB), b""):
+            dst.write(comp.compress(chunk))
+        dst.write(comp.flush())
+
+
+def descomprimir(ruta_z, ruta_bin):
+    """Descomprime el maestro descargado y lo deja listo para mmap (reemplazo atómico)."""
+    decomp = zlib.decompressobj()
+    tmp = ruta_bin + '.tmp'
+    with open(ruta_z, 'rb') as src, open(tmp, 'wb') as dst:
+        for chunk in iter(lambda: src.read(BLOQUE_ZLIB), b""):
+            dst.write(decomp.decompress(chunk))
+        dst.write(decomp.flush())
+    os.replace(tmp, ruta_bin)
@@ -0,0 +1,177 @@
+import os
+import sys
+import json
+import threading
+import numpy as np
+
+SIN_TAMANO = -1
+HASH_VACIO = b'\x00' * 16
+
+_cache_lock = threading.Lock()
+_cache_indices = {} # ruta absoluta -> (mtime_ns, size, ManifestIndex)
+
+
+def _a_entero(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return SIN_TAMANO
+
+
+def _a_digest(valor):
+    try:
+        digest = bytes.fromhex(valor) if valor else HASH_VACIO
+    except (TypeError, ValueError):
+        return HASH_VACIO
+    return digest if len(digest) == 16 else HASH_VACIO
+
+
+class ManifestIndex:
+    """
+    Vista compacta de master_songs.json en columnas.
+
+    - carpetas: rutas relativas únicas (la clave de grupo de cada canción), internadas.
+    - carpeta_idx / tamanos / hashes: arrays de numpy, una fila por archivo
+      (hashes es una matriz n x 16 de uint8 con el MD5 binario).
+    - nombres / ids: listas de strings internados ('song.ini' se guarda una sola vez).
+    - grupo_orden / grupo_limites: archivos de cada canción precalculados,
+      grupo_orden[grupo_limites[g]:grupo_limites[g + 1]] son las filas de carpetas[g].
+    """
+
+    def __init__(self, carpetas, carpeta_idx, nombres, ids, hashes, tamanos, info=None, grupo_orden=None, grupo_limites=None):
+        self.carpetas = carpetas
+        self.carpeta_idx = np.asarray(carpeta_idx, dtype=np.int32)
+        self.nombres = nombres
+        self.ids = ids
+        # MD5 como 16 bytes por fila (no 'S16': numpy recorta los \x00 finales)
+        if isinstance(hashes, list):
+            hashes = np.frombuffer(b''.join(hashes), dtype=np.uint8)
+        self.hashes = np.asarray(hashes, dtype=np.uint8).reshape(-1, 16)
+        self.tiene_hash = self.hashes.any(axis=1)
+        self.tamanos = np.asarray(tamanos, dtype=np.int64)
+        self.info = info or {}
+
+        # Rutas normalizadas una sola vez por carpeta (no por archivo)
+        self.carpetas_norm = [sys.intern(c.replace('\\', '/')) for c in carpetas]
+
+        if grupo_orden is not None and grupo_limites is not None:
+            # Grupos precalculados (maestro binario)
+            self.grupo_orden = grupo_orden
+            self.grupo_limites = grupo_limites
+        else:
+            self.grupo_orden = np.argsort(self.carpeta_idx, kind='stable')
+            conteo = np.bincount(self.carpeta_idx, minlength=len(carpetas))
+            self.grupo_limites = np.concatenate(([0], np.cumsum(conteo)))
+
+    @classmethod
+    def desde_archivos(cls, archivos, info=None):
+        """Construye el índice desde la lista 'archivos' del maestro (lista de dicts)."""
+        carpetas = []
+        posicion = {}
+        carpeta_idx = []
+        nombres = []
+        ids = []
+        hashes = []
+        tamanos = []
+        for item in archivos:
+            if not isinstance(item, dict):
+                continue
+            rp = item.get('ruta_relativa') or ''
+            g = posicion.get(rp)
+            if g is None:
+                g = posicion[rp] = len(carpetas)
+                carpetas.append(sys.intern(rp))
+            carpeta_idx.append(g)
+            nombres.append(sys.intern(item.get('nombre', '')))
+            ids.append(item.get('id_drive') or item.get('id'))
+            hashes.append(_a_digest(item.get('hash')))
+            tamanos.append(_a_entero(item.get('tamano')))
+        return cls(carpetas, carpeta_idx, nombres, ids, hashes, tamanos, info=info)
+
+    @classmethod
+    def cargar(cls, ruta=os.path.join('data', 'master_songs.json')):
+        """
+        Lee el maestro (master_songs.json o master_songs.bin) una vez por versión
+        del archivo: las llamadas siguientes reutilizan el índice mientras mtime
+        y tamaño no cambien.
+        """
+        ruta_abs = os.path.abspath(ruta)
+        st = os.stat(ruta_abs)
+        with _cache_lock:
+            cacheado = _cache_indices.get(ruta_abs)
+            if cacheado and cacheado[0] == st.st_mtime_ns and cacheado[1] == st.st_size:
+                return cacheado[2]
+
+        if ruta_abs.endswith('.bin'):
+            from src.core import manifest_bin
+            index = manifest_bin.leer(ruta_abs)
+        else:
+            index = cls._cargar_json(ruta_abs)
+
+        with _cache_lock:
+            _cache_indices[ruta_abs] = (st.st_mtime_ns, st.st_size, index)
+        return index
+
+    @classmethod
+    def liberar(cls, ruta):
+        """
+        Olvida el índice cacheado. El mmap de un .bin se cierra cuando nadie más
+        usa el índice ni sus columnas; hasta entonces, en Windows, el archivo no se
+        puede reemplazar (por eso el maestro nuevo se descomprime con otro nombre).
+        """
+        with _cache_lock:
+            _cache_indices.pop(os.path.abspath(ruta), None)
+
+    @classmethod
+    def _cargar_json(cls, ruta_abs):
+        with open(ruta_abs, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            archivos = data.get('archivos', [])
+            info = data.get('info', {})
+        else:
+            archivos, info = data, {}
+        if not isinstance(archivos, list):
+            raise ValueError("master_songs.json is not a valid list of files.")
+        index = cls.desde_archivos(archivos, info=info)
+        del data, archivos # Los dicts no se conservan
+        return index
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def hash_hex(self, i):
+        return self.hashes[i].tobytes().hex() if self.tiene_hash[i] else None
+
+    def item(self, i):
+        """Materializa la fila i con el formato de master_songs.json."""
+        i = int(i)
+        tamano = int(self.tamanos[i])
+        id_drive = self.ids[i]
+        return {
+            'nombre': self.nombres[i],
+            'ruta_relativa': self.carpetas[self.carpeta_idx[i]],
+            'id_drive': id_drive,
+            'hash': self.hash_hex(i),
+            'tamano': str(tamano) if tamano != SIN_TAMANO else None,
+        }
+
+    def tamanos_locales(self, filas, stat_index):
+        """
+        Stat de cada fila a través del StatIndex.
+        Retorna (array de tamaños locales con SIN_TAMANO si falta, lista de stats).
+        """
+        stats = [stat_index.stat(self.carpetas_norm[self.carpeta_idx[i]], self.nombres[i]) for i in filas]
+        locales = np.fromiter((st.st_size if st is not None else SIN_TAMANO for st in stats),
+                              dtype=np.int64, count=len(stats))
+        return locales, stats
+
+    def comparar_tamanos(self, filas, locales):
+        """
+        Comparación vectorizada contra el maestro.
+        Retorna (faltantes, distinto_tamano) como máscaras booleanas sobre filas.
+        """
+        remotos = self.tamanos[filas]
+        faltantes = locales == SIN_TAMANO
+        distinto = ~faltantes & ((remotos == SIN_TAMANO) | (remotos != locales))
+        return faltantes, distinto
@@ -0,0 +1,54 @@
+import os
+
+
+class StatIndex:
+    """
+    Índice de metadatos locales para comparar con el maestro.
+    Cada carpeta de canción se lista una sola vez con os.scandir y cada
+    archivo se stat'ea como mucho una vez por escaneo (en Windows el stat
+    viene gratis con el listado del directorio).
+    """
+
+    def __init__(self, rs):
+        self.rs = rs
+        self._carpetas = {} # ruta_relativa normalizada -> {nombre: DirEntry} o None si no existe
+        self._stats = {}
+
+    @staticmethod
+    def _norm(ruta):
+        # En Windows el sistema de archivos no distingue mayúsculas
+        return os.path.normcase(ruta.replace('\\', '/').strip('/'))
+
+    def _listar(self, ruta_relativa):
+        k = self._norm(ruta_relativa)
+        if k in self._carpetas:
+            return self._carpetas[k]
+        entradas = None
+        try:
+            with os.scandir(os.path.join(self.rs, ruta_relativa.replace('\\', '/'))) as it:
+                entradas = {os.path.normcase(e.name): e for e in it}
+        except OSError: # Carpeta inexistente o inaccesible
+            entradas = None
+        self._carpetas[k] = entradas
+        return entradas
+
+    def existe_carpeta(self, ruta_relativa):
+        return self._listar(ruta_relativa) is not None
+
+    def stat(self, ruta_relativa, nombre):
+        """Devuelve el os.stat_result del archivo o None si no existe."""
+        clave = (self._norm(ruta_relativa), os.path.normcase(nombre))
+        if clave in self._stats:
+            return self._stats[clave]
+        resultado = None
+        entradas = self._listar(ruta_relativa)
+        if entradas:
+            entry = entradas.get(clave[1])
+            if entry is not None:
+                try:
+                    if entry.is_file():
+                        resultado = entry.stat()
+                except OSError:
+                    resultado = None
+        self._stats[clave] = resultado
+        return resultado
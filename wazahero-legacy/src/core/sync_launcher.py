@@ -1,9 +1,12 @@
 import os
+import sys
 import json
-import io
 from googleapiclient.discovery import build
 from google.oauth2 import service_account
-from googleapiclient.http import MediaIoBaseDownload
+
+# Permite ejecutarlo como script suelto (python src/core/sync_launcher.py)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.core.transfer import descargar_reanudable
 
 # --- CONFIGURACIÓN TÉCNICA ---
 SERVICE_ACCOUNT_FILE = 'credentials.json'
@@ -29,18 +32,20 @@ def cargar_configuracion():
     
     return ruta_por_defecto
 
-def descargar_con_progreso(service, file_id, ruta_destino, nombre_archivo):
-    request = service.files().get_media(fileId=file_id)
-    # Usamos FileIO para escribir directamente en disco y ahorrar RAM con archivos de 24GB
-    fh = io.FileIO(ruta_destino, 'wb')
-    downloader = MediaIoBaseDownload(fh, request, chunksize=1024*1024)
-    done = False
-    
+def descargar_con_progreso(service, file_id, ruta_destino, nombre_archivo, tamano=None, hash_esperado=None):
+    # Descarga reanudable: va a un .part en disco (archivos de 24GB no pasan por la RAM),
+    # con tramos según el tamaño y la latencia (los archivos pequeños en una sola petición)
+    total = int(tamano) if tamano else None
+    recibido = [0]
+
+    def progreso(n):
+        recibido[0] += n
+        if total:
+            print(f"      > {int(recibido[0] * 100 / total)}%", end="\r")
+
     print(f"    [DESCARGANDO] {nombre_archivo}")
-    while done is False:
-        status, done = downloader.next_chunk()
-        if status:
-            print(f"      > {int(status.progress() * 100)}%", end="\r")
+    descargar_reanudable(service, file_id, ruta_destino, hash_esperado=hash_esperado,
+                         tamano_esperado=tamano, progreso=progreso)
     print(f"      > 100% - OK")
 
 def sincronizar():
@@ -72,7 +77,7 @@ def sincronizar():
         os.makedirs(directorio_destino, exist_ok=True)
 
         if not os.path.exists(ruta_final):
-            descargar_con_progreso(service, item['id_drive'], ruta_final, item['nombre'])
+            descargar_con_progreso(service, item['id_drive'], ruta_final, item['nombre'], item.get('tamano'), item.get('hash'))
 
     print("\n¡Sincronización finalizada!")
 
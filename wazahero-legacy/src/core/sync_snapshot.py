@@ -0,0 +1,92 @@
+import os
+import sqlite3
+
+SNAPSHOT_DB = os.path.join('data', 'sync_snapshot.db')
+
+
+def clave_archivo(ruta_relativa, nombre):
+    ruta_relativa = (ruta_relativa or '').replace('\\', '/').strip('/')
+    return f"{ruta_relativa}/{nombre}" if ruta_relativa else nombre
+
+
+class SyncSnapshot:
+    """
+    Última versión verificada del maestro junto con el sello local (mtime, size)
+    de cada archivo que coincidió. En el siguiente escaneo, las entradas cuyo
+    hash y tamaño remotos no cambiaron solo necesitan un stat para confirmarse.
+    """
+
+    def __init__(self, rs, ruta_db=SNAPSHOT_DB):
+        self.ruta_db = ruta_db
+        os.makedirs(os.path.dirname(ruta_db) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(ruta_db, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS verificados ("
+            " clave TEXT PRIMARY KEY,"
+            " hash TEXT,"
+            " tamano INTEGER NOT NULL,"
+            " mtime REAL NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+
+        # Si cambió la carpeta Songs, los sellos anteriores no sirven
+        row = self._conn.execute("SELECT v FROM meta WHERE k = 'ruta_songs'").fetchone()
+        rs_abs = os.path.abspath(rs)
+        if not row or row[0] != rs_abs:
+            self._conn.execute("DELETE FROM verificados")
+            self._conn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('ruta_songs', ?)", (rs_abs,))
+        self._conn.commit()
+
+        self._sellos = {
+            clave: (hash_val, tamano, mtime, size)
+            for clave, hash_val, tamano, mtime, size in self._conn.execute("SELECT clave, hash, tamano, mtime, size FROM verificados")
+        }
+        self._nuevos = {}
+        self._invalidos = set()
+        self._vistos = set()
+
+    def vigente(self, clave, hash_remoto, tamano_remoto, stat):
+        """True si la entrada no cambió en el maestro y el archivo local conserva su sello."""
+        self._vistos.add(clave)
+        sello = self._sellos.get(clave)
+        if not sello or stat is None:
+            return False
+        return (sello[0] == hash_remoto and sello[1] == tamano_remoto
+                and sello[2] == stat.st_mtime and sello[3] == stat.st_size)
+
+    def sellar(self, clave, hash_remoto, tamano_remoto, stat):
+        self._vistos.add(clave)
+        self._nuevos[clave] = (hash_remoto, tamano_remoto, stat.st_mtime, stat.st_size)
+        self._invalidos.discard(clave)
+
+    def invalidar(self, clave):
+        self._vistos.add(clave)
+        self._nuevos.pop(clave, None)
+        if clave in self._sellos:
+            self._invalidos.add(clave)
+
+    def guardar(self, completo=True):
+        """
+        Persiste los sellos nuevos y borra los invalidados. Con completo=True
+        (escaneo de todo el maestro) también borra las entradas que desaparecieron.
+        """
+        borrar = set(self._invalidos)
+        if completo:
+            borrar.update(k for k in self._sellos if k not in self._vistos)
+        cur = self._conn.cursor()
+        cur.executemany("DELETE FROM verificados WHERE clave = ?", ((k,) for k in borrar))
+        cur.executemany(
+            "INSERT OR REPLACE INTO verificados (clave, hash, tamano, mtime, size) VALUES (?, ?, ?, ?, ?)",
+            ((k,) + v for k, v in self._nuevos.items())
+        )
+        self._conn.commit()
+        for k in borrar:
+            self._sellos.pop(k, None)
+        self._sellos.update(self._nuevos)
+        self._nuevos = {}
+        self._invalidos = set()
+        self._vistos = set()
+
+    def close(self):
+        self._conn.close()
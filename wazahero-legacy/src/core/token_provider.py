@@ -0,0 +1,92 @@
+import os
+import json
+import datetime
+import threading
+from google.auth import credentials
+
+TOKEN_CACHE = os.path.join('data', 'token_cache.json')
+MARGEN_RENOVACION = datetime.timedelta(minutes=5) # Renovar antes de que caduque
+
+
+def _ahora():
+    # google-auth trabaja con datetimes UTC sin zona horaria
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _leer_cache(ruta):
+    try:
+        with open(ruta, 'r') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+class TokenCompartido(credentials.Credentials):
+    """
+    Credenciales de la cuenta de servicio compartidas por todos los hilos.
+    Un solo hilo renueva el token (con margen antes de que caduque) y el
+    resultado se guarda en data/token_cache.json con su expiración, así otro
+    proceso (json_mapper) o un launcher reiniciado lo reutilizan sin pedir otro.
+    """
+
+    def __init__(self, crear_credenciales, cuenta, ruta=TOKEN_CACHE):
+        super().__init__()
+        self._crear_credenciales = crear_credenciales
+        self._interna = None
+        self.cuenta = cuenta or 'default'
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._tomar_de_disco()
+
+    @property
+    def expired(self):
+        if not self.expiry:
+            return False
+        return _ahora() >= self.expiry - MARGEN_RENOVACION
+
+    def _tomar_de_disco(self):
+        """Adopta el token guardado si sigue vigente. Retorna True si lo hizo."""
+        entrada = _leer_cache(self.ruta).get(self.cuenta)
+        if not entrada:
+            return False
+        try:
+            expiry = datetime.datetime.fromisoformat(entrada['expiry'])
+        except (KeyError, TypeError, ValueError):
+            return False
+        if _ahora() >= expiry - MARGEN_RENOVACION:
+            return False
+        if entrada.get('token') == self.token:
+            return False
+        self.token = entrada.get('token')
+        self.expiry = expiry
+        return True
+
+    def _guardar_en_disco(self):
+        try:
+            os.makedirs(os.path.dirname(self.ruta) or '.', exist_ok=True)
+            data = _leer_cache(self.ruta)
+            data[self.cuenta] = {'token': self.token, 'expiry': self.expiry.isoformat() if self.expiry else None}
+            tmp = f"{self.ruta}.{os.getpid()}.tmp"
+            with open(tmp, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp, self.ruta)
+        except OSError as e:
+            print(f"[WAR] No se pudo guardar el token: {e}")
+
+    def refresh(self, request):
+        token_previo = self.token
+        with self._lock:
+            # Otro hilo lo renovó mientras esperábamos el lock
+            if self.token != token_previo and self.valid:
+                return
+            # Otro proceso pudo haberlo renovado y guardado (si el token actual
+            # sigue vigente, se llegó aquí por un 401: hay que pedir uno nuevo)
+            if not self.valid and self._tomar_de_disco():
+                return
+            if self._interna is None:
+                self._interna = self._crear_credenciales()
+            self._interna.refresh(request)
+            self.token = self._interna.token
+            self.expiry = self._interna.expiry
+            self._guardar_en_disco()
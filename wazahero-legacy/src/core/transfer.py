@@ -0,0 +1,377 @@
+import os
+import json
+import errno
+import shutil
+import time
+import socket
+import hashlib
+import threading
+import httplib2
+from googleapiclient.errors import HttpError
+
+from src.core.hash_engine import BLOQUE_LECTURA
+
+# Descargas reanudables: los bytes van a '<destino>.part' y el avance confirmado
+# a '<destino>.part.json'. Un corte (red, cierre de la app) continúa desde el
+# último offset confirmado con peticiones HTTP Range.
+SUFIJO_PARCIAL = '.part'
+SUFIJO_ESTADO = '.part.json'
+SUFIJO_COPIA = '.copia' # Temporal de instalar_copia: puede ser un hardlink, nunca se escribe encima
+CHUNK_DESCARGA = 5 * 1024 * 1024 # Tramo inicial de los archivos que no caben en una petición
+# Tamaño de tramo adaptativo: cada petición debería durar ~DURACION_TRAMO segundos
+TRAMO_MINIMO = 256 * 1024
+TRAMO_MAXIMO = 16 * 1024 * 1024 # Cada tramo se recibe en memoria antes de escribirse
+TRAMO_UNICO = 8 * 1024 * 1024   # Hasta este tamaño el archivo se pide de una vez
+DURACION_TRAMO = 2.0
+PREASIGNAR_DESDE = 1024 * 1024 # Archivos de tamaño conocido que se reservan enteros en disco
+REINTENTOS = 5
+ESPERA_BASE = 2 # Segundos; se duplica en cada reintento seguido
+ESTADOS_REINTENTABLES = (429, 500, 502, 503, 504)
+ERRORES_RED = (socket.timeout, ConnectionError, httplib2.HttpLib2Error)
+
+
+class DescargaCancelada(Exception):
+    """La descarga se detuvo a pedido del usuario; el .part queda para reanudar."""
+
+
+class Cancelacion(threading.Event):
+    """
+    Evento de parada compartido por las descargas de una sesión. Además de
+    marcarse, set() corta las conexiones que están recibiendo un tramo, así la
+    parada no espera a que termine un bloque de varios MB.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock_conexiones = threading.Lock()
+        self._conexiones = set()
+
+    def registrar(self, http):
+        with self._lock_conexiones:
+            self._conexiones.add(http)
+
+    def quitar(self, http):
+        with self._lock_conexiones:
+            self._conexiones.discard(http)
+
+    def set(self):
+        super().set()
+        with self._lock_conexiones:
+            conexiones = list(self._conexiones)
+        for http in conexiones:
+            _cortar_conexiones(http)
+
+
+def _cortar_conexiones(http):
+    # AuthorizedHttp envuelve un httplib2.Http en .http
+    interno = getattr(http, 'http', http)
+    for conn in list(getattr(interno, 'connections', {}).values()):
+        sock = getattr(conn, 'sock', None)
+        if sock is None:
+            continue
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            conn.close() # La próxima petición del hilo abre una conexión nueva
+        except Exception:
+            pass
+
+
+class TramoAdaptativo:
+    """
+    Decide cuántos bytes pedir en cada petición Range. Arranca según el tamaño
+    esperado (los archivos pequeños van en una sola petición) y después ajusta
+    con la latencia medida de cada tramo: si el enlace es rápido o la latencia
+    domina, los tramos crecen; si un tramo tarda mucho, se achican. El cambio
+    entre un tramo y el siguiente es como mucho x2 (o /2).
+    """
+
+    def __init__(self, tamano=None, inicial=CHUNK_DESCARGA, minimo=TRAMO_MINIMO, maximo=TRAMO_MAXIMO):
+        self.minimo = minimo
+        self.maximo = maximo
+        try:
+            tamano = int(tamano) if tamano is not None else None
+        except (TypeError, ValueError):
+            tamano = None
+        if tamano is not None and tamano <= TRAMO_UNICO:
+            self.actual = max(1, tamano)
+        else:
+            self.actual = min(maximo, max(minimo, inicial))
+
+    def siguiente(self, restante=None):
+        """Bytes a pedir; si lo que falta es poco más de un tramo, se pide todo junto."""
+        if restante is not None and 0 < restante <= self.actual * 1.5:
+            return restante
+        return self.actual
+
+    def medir(self, recibidos, segundos):
+        """Ajusta el tramo con lo que tardó la última petición."""
+        if recibidos <= 0 or segundos <= 0:
+            return
+        objetivo = recibidos / segundos * DURACION_TRAMO
+        objetivo = min(self.actual * 2, max(self.actual / 2, objetivo))
+        self.actual = int(min(self.maximo, max(self.minimo, objetivo)))
+
+
+def _preasignar(fh, tamano):
+    """Reserva el archivo completo de una vez (menos fragmentación, y sin espacio falla al empezar)."""
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fh.fileno(), 0, tamano)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+    # Windows: extender el archivo reserva los clusters en NTFS
+    fh.truncate(tamano)
+
+
+def _esperar(segundos, cancelar):
+    if cancelar is None:
+        time.sleep(segundos)
+    elif cancelar.wait(segundos):
+        raise DescargaCancelada()
+
+
+def ruta_parcial(ruta_destino):
+    return ruta_destino + SUFIJO_PARCIAL
+
+
+def ruta_estado(ruta_destino):
+    return ruta_destino + SUFIJO_ESTADO
+
+
+def _leer_estado(ruta_destino):
+    try:
+        with open(ruta_estado(ruta_destino), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _guardar_estado(ruta_destino, estado):
+    tmp = ruta_estado(ruta_destino) + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(estado, f)
+    os.replace(tmp, ruta_estado(ruta_destino))
+
+
+def offset_reanudable(ruta_destino, file_id, hash_esperado=None):
+    """
+    Bytes ya confirmados de una descarga anterior del mismo archivo (0 si no hay
+    nada que aprovechar: otro id, otro hash remoto o .part más corto que el estado).
+    """
+    estado = _leer_estado(ruta_destino)
+    if not estado or estado.get('id_drive') != file_id:
+        return 0
+    if hash_esperado and estado.get('hash') and estado['hash'] != hash_esperado:
+        return 0 # El archivo cambió en Drive: lo descargado no sirve
+    try:
+        tamano_parcial = os.path.getsize(ruta_parcial(ruta_destino))
+    except OSError:
+        return 0
+    offset = int(estado.get('offset', 0))
+    return offset if offset <= tamano_parcial else 0
+
+
+def descartar_parcial(ruta_destino):
+    for ruta in (ruta_parcial(ruta_destino), ruta_estado(ruta_destino)):
+        try:
+            os.remove(ruta)
+        except OSError:
+            pass
+
+
+def _total_de_respuesta(resp):
+    if 'content-range' in resp:
+        total = resp['content-range'].rsplit('/', 1)[1]
+        return int(total) if total != '*' else None
+    return None
+
+
+def descargar_reanudable(service, file_id, ruta_destino, hash_esperado=None,
+                         chunksize=None, reintentos=REINTENTOS,
+                         progreso=None, al_reintentar=None, cancelar=None, limitador=None,
+                         tamano_esperado=None):
+    """
+    Descarga file_id a ruta_destino por tramos HTTP Range; con chunksize=None el
+    tamaño lo decide TramoAdaptativo (según tamano_esperado y la latencia de
+    cada tramo), con un número queda fijo.
+    Tras cada tramo se escribe el .part y se confirma el offset en el estado;
+    los errores de red y 429/5xx se reintentan desde ese offset.
+    El MD5 se calcula sobre los bytes a medida que llegan; si no coincide con
+    hash_esperado (o el tamaño con tamano_esperado) se descarta el .part y se
+    lanza ValueError. Si todo coincide, el archivo final aparece de una vez
+    (os.replace): ruta_destino nunca queda truncada. Retorna el MD5 en hex.
+
+    progreso(n): bytes recibidos en cada tramo.
+    al_reintentar(motivo): código HTTP o excepción de red antes de cada reintento.
+    cancelar: threading.Event (idealmente Cancelacion) revisado entre tramos; al
+    activarse lanza DescargaCancelada y conserva el .part y su estado.
+    limitador: LimitadorBanda compartido; con tope activo los tramos se achican
+    y cada uno se descuenta del balde.
+    """
+    os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
+    request = service.files().get_media(fileId=file_id)
+    uri = request.uri
+    http = request.http
+    headers_base = dict(request.headers)
+
+    offset = offset_reanudable(ruta_destino, file_id, hash_esperado)
+    parcial = ruta_parcial(ruta_destino)
+    if cancelar is not None and cancelar.is_set():
+        raise DescargaCancelada()
+    total = None
+    fallos = 0
+    tramos = TramoAdaptativo(tamano_esperado) if chunksize is None else None
+    if hasattr(cancelar, 'registrar'):
+        cancelar.registrar(http) # Para poder cortar el tramo en curso
+    try:
+        with open(parcial, 'r+b' if offset else 'w+b') as fh:
+            fh.seek(offset)
+            fh.truncate() # Lo escrito después del último offset confirmado no es fiable
+
+            # Al reanudar, el MD5 necesita los bytes ya descargados (una lectura del .part)
+            hash_md5 = hashlib.md5()
+            fh.seek(0)
+            for chunk in iter(lambda: fh.read(BLOQUE_LECTURA), b""):
+                hash_md5.update(chunk)
+            if tamano_esperado is not None and int(tamano_esperado) >= PREASIGNAR_DESDE:
+                _preasignar(fh, int(tamano_esperado))
+            fh.seek(offset)
+
+            while total is None or offset < total:
+                if cancelar is not None and cancelar.is_set():
+                    raise DescargaCancelada()
+                if tramos is not None:
+                    conocido = total if total is not None else (int(tamano_esperado) if tamano_esperado is not None else None)
+                    tramo = tramos.siguiente(conocido - offset if conocido is not None else None)
+                else:
+                    tramo = chunksize
+                if limitador:
+                    tramo = limitador.tramo_sugerido(tramo)
+                headers = dict(headers_base)
+                headers['range'] = f"bytes={offset}-{offset + tramo - 1}"
+                try:
+                    inicio = time.monotonic()
+                    resp, content = http.request(uri, method='GET', headers=headers)
+                except Exception as e:
+                    if cancelar is not None and cancelar.is_set():
+                        raise DescargaCancelada() from e # Conexión cortada por la parada
+                    if not isinstance(e, ERRORES_RED):
+                        raise
+                    fallos += 1
+                    if al_reintentar:
+                        al_reintentar(e)
+                    if fallos > reintentos:
+                        raise
+                    _esperar(ESPERA_BASE * (2 ** (fallos - 1)), cancelar)
+                    continue
+                if cancelar is not None and cancelar.is_set():
+                    raise DescargaCancelada() # Lo recibido se descarta: el offset confirmado no cambia
+
+                if resp.status == 206:
+                    total = _total_de_respuesta(resp)
+                elif resp.status == 200:
+                    # El servidor ignoró el Range: viene el archivo completo desde el byte 0
+                    if offset:
+                        fh.seek(0)
+                        fh.truncate()
+                        offset = 0
+                        hash_md5 = hashlib.md5()
+                    total = len(content)
+                elif resp.status == 416:
+                    # Rango fuera del archivo: ya está completo (o es un archivo de 0 bytes)
+                    total = _total_de_respuesta(resp)
+                    if total is None or offset >= total:
+                        total = offset
+                        break
+                    fh.seek(0)
+                    fh.truncate()
+                    offset = 0
+                    hash_md5 = hashlib.md5()
+                    continue
+                elif resp.status in ESTADOS_REINTENTABLES:
+                    fallos += 1
+                    if al_reintentar:
+                        al_reintentar(resp.status)
+                    if fallos > reintentos:
+                        raise HttpError(resp, content, uri=uri)
+                    _esperar(ESPERA_BASE * (2 ** (fallos - 1)), cancelar)
+                    continue
+                else:
+                    raise HttpError(resp, content, uri=uri)
+
+                if not content and total is not None and offset < total:
+                    # Respuesta vacía a mitad del archivo: tratar como corte de red
+                    fallos += 1
+                    if fallos > reintentos:
+                        raise HttpError(resp, content, uri=uri)
+                    _esperar(ESPERA_BASE * (2 ** (fallos - 1)), cancelar)
+                    continue
+
+                if 'content-location' in resp and resp['content-location'] != uri:
+                    uri = resp['content-location']
+
+                if tramos is not None:
+                    tramos.medir(len(content), time.monotonic() - inicio)
+                fh.write(content)
+                fh.flush()
+                hash_md5.update(content)
+                if progreso:
+                    progreso(len(content))
+                if limitador:
+                    limitador.consumir(len(content), cancelar)
+                offset += len(content)
+                fallos = 0
+                _guardar_estado(ruta_destino, {'id_drive': file_id, 'hash': hash_esperado, 'offset': offset, 'total': total})
+
+                if total is None:
+                    break # Tamaño desconocido: lo recibido es todo
+            fh.truncate(offset) # Sobrante de la preasignación si el archivo resultó más corto
+    finally:
+        if hasattr(cancelar, 'quitar'):
+            cancelar.quitar(http)
+
+    if tamano_esperado is not None and offset != int(tamano_esperado):
+        descartar_parcial(ruta_destino)
+        raise ValueError(f"Tamaño incorrecto ({offset} != {tamano_esperado} bytes), descarga incompleta.")
+    md5_val = hash_md5.hexdigest()
+    if hash_esperado and md5_val != hash_esperado:
+        descartar_parcial(ruta_destino)
+        raise ValueError(f"MD5 no coincide ({md5_val} != {hash_esperado}), descarga corrupta.")
+
+    os.replace(parcial, ruta_destino)
+    try:
+        os.remove(ruta_estado(ruta_destino))
+    except OSError:
+        pass
+    return md5_val
+
+
+def instalar_copia(origen, ruta_destino, enlazar=True):
+    """
+    Instala en ruta_destino un archivo idéntico que ya está en disco: hardlink
+    si se puede (no ocupa espacio), si no copia. Igual que una descarga, se
+    arma en un temporal y aparece de una vez con os.replace.
+    """
+    os.makedirs(os.path.dirname(ruta_destino), exist_ok=True)
+    temporal = ruta_destino + SUFIJO_COPIA
+    try:
+        os.remove(temporal)
+    except OSError:
+        pass
+    enlazado = False
+    if enlazar:
+        try:
+            os.link(origen, temporal)
+            enlazado = True
+        except OSError: # Otra unidad o sistema de archivos sin hardlinks (FAT32/exFAT)
+            pass
+    if not enlazado:
+        shutil.copyfile(origen, temporal)
+    os.replace(temporal, ruta_destino)
+    descartar_parcial(ruta_destino) # Un .part viejo de este destino ya no sirve
+    return enlazado
@@ -5,7 +5,7 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QLabel, QPushButton,
                               QStackedWidget, QTableWidget, QTableWidgetItem, 
                               QHeaderView, QAbstractItemView, QCheckBox, QLineEdit,
                               QVBoxLayout, QHBoxLayout, QSpacerItem, QSizePolicy,
-                              QGraphicsOpacityEffect, QGraphicsDropShadowEffect)
+                              QGraphicsOpacityEffect, QGraphicsDropShadowEffect, QMessageBox)
 import os
 import webbrowser
 import random
@@ -234,6 +234,7 @@ class LauncherWindow(QMainWindow):
     sig_open_library = pyqtSignal() # Request to open library
     sig_go_home = pyqtSignal() # Request to go home (cleanup)
     sig_update_available = pyqtSignal(str, str) # version, url
+    sig_resume_download = pyqtSignal(str) # "all" | "failed" | "discard"
 
     # Thread-Safe Signals
     _sig_status = pyqtSignal(str, str, str)
@@ -241,7 +242,10 @@ class LauncherWindow(QMainWindow):
     _sig_log = pyqtSignal(str)
     _sig_enable_sync = pyqtSignal(bool)
     _sig_show_selection = pyqtSignal(list) # To trigger selection view
+    _sig_append_selection = pyqtSignal(list) # Rows found while the scan keeps running
+    _sig_selection_scanning = pyqtSignal(bool)
     _sig_show_home = pyqtSignal()
+    _sig_offer_resume = pyqtSignal(int, int) # pending, failed (persisted queue)
 
     def __init__(self):
         super().__init__()
@@ -254,7 +258,10 @@ class LauncherWindow(QMainWindow):
         self._sig_log.connect(self._slot_log)
         self._sig_enable_sync.connect(self._slot_enable_sync)
         self._sig_show_selection.connect(self._slot_show_selection)
+        self._sig_append_selection.connect(self._slot_append_selection)
+        self._sig_selection_scanning.connect(self._slot_selection_scanning)
         self._sig_show_home.connect(self._slot_show_home)
+        self._sig_offer_resume.connect(self._slot_offer_resume)
         self.sig_update_available.connect(self.show_update_notification)
         
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint)
@@ -826,6 +833,8 @@ class LauncherWindow(QMainWindow):
             self.frm_selection_progress.hide() 
             self.btn_selection_go_home.show() 
             self.btn_sync.setEnabled(True) 
+            if self._sync_card_mode == "DOWNLOADING":
+                self.set_sync_card_mode("SYNC") # A resumed queue kept the card on VER PROGRESO
             if hasattr(self, 'btn_config'): self.btn_config.setEnabled(True)
 
             # Restore ALL Nav Buttons
@@ -879,6 +888,50 @@ class LauncherWindow(QMainWindow):
         # Connect signal for dynamic updates
         self.table_songs.itemChanged.connect(self.update_selection_counter)
 
+    def append_table_rows(self, songs_list):
+        if not songs_list:
+            return
+        if not hasattr(self, 'current_songs_data'):
+            self.current_songs_data = []
+
+        # Same layout as populate_table, appended at the end
+        self.table_songs.blockSignals(True)
+        start = self.table_songs.rowCount()
+        self.table_songs.setRowCount(start + len(songs_list))
+        filter_text = self.inp_search.text().lower()
+        check_state = Qt.CheckState.Checked if self.chk_select_all.isChecked() else Qt.CheckState.Unchecked
+
+        for offset, song in enumerate(songs_list):
+            i = start + offset
+            item_check = QTableWidgetItem()
+            item_check.setFlags(Qt.ItemFlag.ItemIsUserCheckable | Qt.ItemFlag.ItemIsEnabled)
+            item_check.setCheckState(check_state)
+            self.table_songs.setItem(i, 0, item_check)
+
+            name_display = f"{song['name']} ({len(song['files'])} archivos)"
+            self.table_songs.setItem(i, 1, QTableWidgetItem(name_display))
+
+            item_status = QTableWidgetItem(song['status'])
+            item_status.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+            self.table_songs.setItem(i, 2, item_status)
+
+            # Respect the active search filter
+            if filter_text and filter_text not in name_display.lower():
+                self.table_songs.setRowHidden(i, True)
+
+        self.current_songs_data.extend(songs_list)
+        self.table_songs.blockSignals(False)
+        self.update_selection_counter()
+
+    def set_selection_scanning_state(self, is_scanning):
+        # While the scan is still streaming rows, downloading is not allowed yet
+        if is_scanning:
+            self.btn_dl_selection.setText("ESCANEANDO...")
+            self.btn_dl_selection.setEnabled(False)
+        else:
+            self.btn_dl_selection.setText("DESCARGAR SELECCIONADOS")
+            self.btn_dl_selection.setEnabled(True)
+
     def update_selection_counter(self, item=None):
         count = 0
         total = self.table_songs.rowCount()
@@ -928,9 +981,18 @@ class LauncherWindow(QMainWindow):
     def show_selection(self, songs):
         self._sig_show_selection.emit(songs)
     
+    def append_selection(self, songs):
+        self._sig_append_selection.emit(songs)
+
+    def set_selection_scanning(self, is_scanning):
+        self._sig_selection_scanning.emit(bool(is_scanning))
+
     def show_home(self):
         self._sig_show_home.emit()
 
+    def offer_resume(self, pending, failed):
+        self._sig_offer_resume.emit(int(pending), int(failed))
+
     def set_status(self, title, msg="", color_hex=""):
         # Emitir señal en lugar de tocar UI directo
         self._sig_status.emit(str(title), str(msg), str(color_hex))
@@ -955,6 +1017,15 @@ class LauncherWindow(QMainWindow):
             self.log(f"UI ERROR: {e}")
             self.set_status("ERROR DE INTERFAZ", str(e), "#FF5555")
 
+    def _slot_append_selection(self, songs):
+        try:
+            self.append_table_rows(songs)
+        except Exception as e:
+            self.log(f"UI ERROR: {e}")
+
+    def _slot_selection_scanning(self, is_scanning):
+        self.set_selection_scanning_state(is_scanning)
+
     def start_download_mode(self):
         self.set_selection_downloading_state(True)
 
@@ -1238,6 +1309,27 @@ class LauncherWindow(QMainWindow):
         anim.start(QPropertyAnimation.DeletionPolicy.DeleteWhenStopped)
         self._update_anim = anim # Keep ref
 
+    def _slot_offer_resume(self, pending, failed):
+        # Leftover queue from a previous session: resume without rescanning
+        box = QMessageBox(self)
+        box.setWindowTitle("Descargas pendientes")
+        partes = []
+        if pending: partes.append(f"{pending} archivos pendientes")
+        if failed: partes.append(f"{failed} fallidos")
+        box.setText(f"Hay descargas sin terminar: {' y '.join(partes)}.\n¿Reanudar ahora?")
+        btn_all = box.addButton("REANUDAR", QMessageBox.ButtonRole.AcceptRole) if pending else None
+        btn_failed = box.addButton("REINTENTAR FALLIDOS", QMessageBox.ButtonRole.ActionRole) if failed else None
+        btn_discard = box.addButton("DESCARTAR", QMessageBox.ButtonRole.DestructiveRole)
+        box.addButton("MÁS TARDE", QMessageBox.ButtonRole.RejectRole)
+        box.exec()
+        clicked = box.clickedButton()
+        if btn_all is not None and clicked is btn_all:
+            self.sig_resume_download.emit("all")
+        elif btn_failed is not None and clicked is btn_failed:
+            self.sig_resume_download.emit("failed")
+        elif clicked is btn_discard:
+            self.sig_resume_download.emit("discard")
+
     def _slot_enable_sync(self, enabled):
         self.btn_sync.setEnabled(enabled)
 
@@ -1,89 +1,323 @@
 import os
+import sys
 import json
 import time
 import socket
-from googleapiclient.discovery import build
+import argparse
+import threading
+import concurrent.futures
+from collections import deque
 from google.oauth2 import service_account
 from googleapiclient.errors import HttpError
 
+# Permite ejecutarlo como script suelto (python src/utils/json_mapper.py)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.core.manifest_index import ManifestIndex
+from src.core import manifest_bin
+from src.core.drive_service import construir_servicio, API_ENDPOINT
+from src.core.token_provider import TokenCompartido
+
 # --- CONFIGURACIÓN ---
 # Asegúrate de que el archivo JSON esté en la misma carpeta
 SERVICE_ACCOUNT_FILE = 'credentials.json'
 ID_CARPETA_MAESTRA = '1K4RFF9QN5n0QLDj7RH73xdA5I4IOlrmj'
 SCOPES = ['https://www.googleapis.com/auth/drive.readonly']
+CARPETA_MIME = 'application/vnd.google-apps.folder'
+WORKERS_ESCANEO = 8       # Consultas simultáneas a Drive
+CARPETAS_POR_CONSULTA = 20 # Carpetas combinadas en un mismo files().list
+ESTADO_MANIFIESTO = 'manifest_state.json' # Token de cambios + mapa de carpetas (modo --incremental)
 
 # Aumentar el tiempo de espera para evitar cortes en carpetas muy grandes
 socket.setdefaulttimeout(300) 
 
-def obtener_estructura_drive(service, folder_id, ruta_actual=""):
-    """Recorre carpetas de forma recursiva y extrae metadatos de archivos."""
-    manifiesto = []
+def listar_hijos(service, carpetas):
+    """
+    Lista en una sola consulta (paginada) los hijos de varias carpetas.
+    carpetas: lista de folder_id. Retorna {folder_id: [items en el orden recibido]}.
+    """
+    padres = " or ".join(f"'{folder_id}' in parents" for folder_id in carpetas)
+    query = f"({padres}) and trashed = false"
+    hijos = {folder_id: [] for folder_id in carpetas}
     page_token = None
-    
-    # Imprimir progreso para saber dónde está el script
-    print(f" -> Escaneando: {ruta_actual if ruta_actual else 'Directorio Raíz'}")
 
     while True:
         try:
-            # Consultar archivos y subcarpetas
-            query = f"'{folder_id}' in parents and trashed = false"
             results = service.files().list(
-                q=query, 
-                fields="nextPageToken, files(id, name, mimeType, md5Checksum, size)",
+                q=query,
+                fields="nextPageToken, files(id, name, mimeType, md5Checksum, size, parents)",
+                pageSize=1000,
                 pageToken=page_token
             ).execute()
-            
-            items = results.get('files', [])
-
-            for item in items:
-                if item['mimeType'] == 'application/vnd.google-apps.folder':
-                    # Si es carpeta, entramos recursivamente
-                    nueva_ruta = os.path.join(ruta_actual, item['name'])
-                    manifiesto.extend(obtener_estructura_drive(service, item['id'], nueva_ruta))
-                else:
-                    # Si es archivo, guardamos sus datos
-                    manifiesto.append({
-                        "nombre": item['name'],
-                        "ruta_relativa": ruta_actual,
-                        "id_drive": item['id'],
-                        "hash": item.get('md5Checksum'),
-                        "tamano": item.get('size')
-                    })
-            
-            # Verificar si hay más páginas de archivos en esta misma carpeta
-            page_token = results.get('nextPageToken')
-            if not page_token:
-                break
-                
         except HttpError as error:
             print(f" [!] Error de API: {error}. Reintentando en 5 segundos...")
             time.sleep(5)
             continue
-            
+
+        for item in results.get('files', []):
+            for padre in item.get('parents', []):
+                if padre in hijos:
+                    hijos[padre].append(item)
+                    break
+
+        # Verificar si hay más páginas para este grupo de carpetas
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            break
+
+    return hijos
+
+def obtener_estructura_drive(crear_servicio, folder_id, workers=WORKERS_ESCANEO, carpetas=None):
+    """
+    Recorre el árbol de Drive en anchura, listando muchas carpetas a la vez
+    con un pool acotado de hilos (un servicio por hilo) y agrupando varias
+    carpetas por consulta. Devuelve la misma lista 'archivos' que el
+    recorrido recursivo carpeta por carpeta.
+    Si se pasa 'carpetas', se completa con {id: {'nombre', 'padre'}} de cada subcarpeta.
+    """
+    local = threading.local()
+
+    def listar(carpetas):
+        # httplib2 no es thread-safe: cada hilo usa su propio servicio
+        if not hasattr(local, 'service'):
+            local.service = crear_servicio()
+        return listar_hijos(local.service, carpetas)
+
+    hijos = {}
+    pendientes = deque([folder_id])
+    en_curso = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        while pendientes or en_curso:
+            while pendientes and len(en_curso) < workers * 2:
+                lote = [pendientes.popleft() for _ in range(min(CARPETAS_POR_CONSULTA, len(pendientes)))]
+                en_curso[pool.submit(listar, lote)] = lote
+
+            listos, _ = concurrent.futures.wait(en_curso, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in listos:
+                en_curso.pop(future)
+                for padre, items in future.result().items():
+                    hijos[padre] = items
+                    for item in items:
+                        if item['mimeType'] == CARPETA_MIME:
+                            pendientes.append(item['id'])
+                            if carpetas is not None:
+                                carpetas[item['id']] = {'nombre': item['name'], 'padre': padre}
+            print(f" -> Carpetas escaneadas: {len(hijos)} (en cola: {len(pendientes)})", end="\r")
+    print()
+
+    # Reconstruir el orden del recorrido en profundidad (archivos y subcarpetas intercalados)
+    manifiesto = []
+    pila = [(iter(hijos.get(folder_id, [])), "")]
+    while pila:
+        items, ruta_actual = pila[-1]
+        item = next(items, None)
+        if item is None:
+            pila.pop()
+        elif item['mimeType'] == CARPETA_MIME:
+            pila.append((iter(hijos.get(item['id'], [])), os.path.join(ruta_actual, item['name'])))
+        else:
+            manifiesto.append({
+                "nombre": item['name'],
+                "ruta_relativa": ruta_actual,
+                "id_drive": item['id'],
+                "hash": item.get('md5Checksum'),
+                "tamano": item.get('size')
+            })
+
     return manifiesto
 
-def ejecutar():
+def ruta_carpeta(carpetas, folder_id):
+    """Ruta relativa de una carpeta conocida, o None si no cuelga de la carpeta maestra."""
+    partes = []
+    while folder_id in carpetas and len(partes) <= len(carpetas):
+        carpeta = carpetas[folder_id]
+        if carpeta['padre'] is None:
+            return os.path.join("", *reversed(partes))
+        partes.append(carpeta['nombre'])
+        folder_id = carpeta['padre']
+    return None
+
+def _bajo_ruta(ruta, base):
+    return ruta == base or ruta.startswith(base + os.sep)
+
+def aplicar_cambios(crear_servicio, archivos, estado, workers=WORKERS_ESCANEO):
+    """
+    Lee el feed de cambios de Drive desde estado['page_token'] y aplica sobre la
+    lista 'archivos' del manifiesto anterior las altas, modificaciones,
+    movimientos y borrados (papelera). Actualiza 'estado' (token y carpetas).
+    Retorna (archivos, nº de cambios aplicados).
+    """
+    service = crear_servicio()
+    carpetas = estado['carpetas']
+    raiz = estado['raiz']
+    por_id = {item['id_drive']: item for item in archivos}
+    nuevas = []  # Carpetas que entran al árbol con contenido desconocido
+    aplicados = 0
+
+    def quitar_carpeta(folder_id):
+        base = ruta_carpeta(carpetas, folder_id)
+        if base is None:
+            carpetas.pop(folder_id, None)
+            return
+        for fid in [fid for fid in carpetas if fid != raiz and _bajo_ruta(ruta_carpeta(carpetas, fid) or "", base)]:
+            del carpetas[fid]
+        for id_drive in [i for i, item in por_id.items() if _bajo_ruta(item['ruta_relativa'], base)]:
+            del por_id[id_drive]
+
+    def aplicar(cambio):
+        file_id = cambio.get('fileId')
+        f = cambio.get('file') or {}
+        if file_id == raiz:
+            return False
+        es_carpeta = f.get('mimeType') == CARPETA_MIME or file_id in carpetas
+        padre = None
+        if not (cambio.get('removed') or f.get('trashed')):
+            padre = next((p for p in f.get('parents', []) if ruta_carpeta(carpetas, p) is not None), None)
+
+        if padre is None:
+            # Borrado, en la papelera o movido fuera de la carpeta maestra
+            if es_carpeta and file_id in carpetas:
+                quitar_carpeta(file_id)
+                return True
+            return por_id.pop(file_id, None) is not None
+
+        if es_carpeta:
+            ruta_vieja = ruta_carpeta(carpetas, file_id) if file_id in carpetas else None
+            carpetas[file_id] = {'nombre': f['name'], 'padre': padre}
+            ruta_nueva = ruta_carpeta(carpetas, file_id)
+            if ruta_vieja is None:
+                nuevas.append(file_id)
+            elif ruta_vieja != ruta_nueva:
+                # Renombrada o movida: reescribir la ruta de todo lo que contiene
+                for item in por_id.values():
+                    if _bajo_ruta(item['ruta_relativa'], ruta_vieja):
+                        item['ruta_relativa'] = ruta_nueva + item['ruta_relativa'][len(ruta_vieja):]
+            return True
+
+        por_id[file_id] = {
+            "nombre": f['name'],
+            "ruta_relativa": ruta_carpeta(carpetas, padre),
+            "id_drive": file_id,
+            "hash": f.get('md5Checksum'),
+            "tamano": f.get('size')
+        }
+        return True
+
+    page_token = estado['page_token']
+    while True:
+        try:
+            results = service.changes().list(
+                pageToken=page_token,
+                fields="nextPageToken, newStartPageToken, changes(fileId, removed, file(id, name, mimeType, md5Checksum, size, parents, trashed))",
+                pageSize=1000,
+                includeRemoved=True,
+                spaces='drive'
+            ).execute()
+        except HttpError as error:
+            if error.resp.status in (400, 403, 404, 410):
+                raise # Token inválido o caducado: hace falta un escaneo completo
+            print(f" [!] Error de API: {error}. Reintentando en 5 segundos...")
+            time.sleep(5)
+            continue
+
+        for cambio in results.get('changes', []):
+            if aplicar(cambio):
+                aplicados += 1
+
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            estado['page_token'] = results.get('newStartPageToken', estado['page_token'])
+            break
+
+    # Las carpetas nuevas (o traídas desde fuera) se listan completas
+    for folder_id in nuevas:
+        if folder_id not in carpetas:
+            continue
+        base = ruta_carpeta(carpetas, folder_id)
+        if base is None:
+            continue
+        for item in obtener_estructura_drive(crear_servicio, folder_id, workers=workers, carpetas=carpetas):
+            item['ruta_relativa'] = os.path.join(base, item['ruta_relativa']) if item['ruta_relativa'] else base
+            por_id[item['id_drive']] = item
+
+    return list(por_id.values()), aplicados
+
+def cargar_estado(ruta=ESTADO_MANIFIESTO):
+    if not os.path.exists(ruta):
+        return None
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def guardar_estado(estado, ruta=ESTADO_MANIFIESTO):
+    tmp = ruta + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(tmp, ruta)
+
+def generar_binario(data_final, destino=manifest_bin.NOMBRE_COMPRIMIDO):
+    """Escribe master_songs.bin.z a partir del mismo contenido que master_songs.json."""
+    index = ManifestIndex.desde_archivos(data_final["archivos"], info=data_final["info"])
+    ruta_bin = destino[:-2] if destino.endswith('.z') else destino + '.bin'
+    manifest_bin.escribir(index, ruta_bin)
+    manifest_bin.comprimir(ruta_bin, destino)
+    os.remove(ruta_bin)
+    print(f" -> {destino}: {os.path.getsize(destino) / 1024:.1f} KB")
+
+def escaneo_completo(crear_servicio):
+    """Recorre todo el árbol y devuelve (archivos, estado para el modo incremental)."""
+    # El token se pide antes del escaneo: lo que cambie mientras tanto se reaplica después
+    service = crear_servicio()
+    token = service.changes().getStartPageToken().execute().get('startPageToken')
+    carpetas = {ID_CARPETA_MAESTRA: {'nombre': '', 'padre': None}}
+    archivos = obtener_estructura_drive(crear_servicio, ID_CARPETA_MAESTRA, carpetas=carpetas)
+    estado = {'raiz': ID_CARPETA_MAESTRA, 'page_token': token, 'carpetas': carpetas}
+    return archivos, estado
+
+def ejecutar(incremental=False):
     print("--- INICIANDO GENERADOR DE MANIFIESTO ---")
     
-    if not os.path.exists(SERVICE_ACCOUNT_FILE):
+    if not API_ENDPOINT and not os.path.exists(SERVICE_ACCOUNT_FILE):
         print(f"ERROR: No se encontró el archivo de credenciales: {SERVICE_ACCOUNT_FILE}")
         return
 
     try:
-        # Autenticación con la cuenta de servicio
-        creds = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_FILE, 
-            scopes=SCOPES
-        )
-        
-        # Construcción del servicio con credenciales explícitas
-        service = build('drive', 'v3', credentials=creds)
+        if API_ENDPOINT:
+            creds = None
+            print(f"Usando API de Drive en: {API_ENDPOINT}")
+        else:
+            # Autenticación con la cuenta de servicio
+            cuenta = service_account.Credentials.from_service_account_file(
+                SERVICE_ACCOUNT_FILE, 
+                scopes=SCOPES
+            )
+            # Token compartido por los hilos del escaneo (y con el launcher, vía data/token_cache.json)
+            creds = TokenCompartido(lambda: cuenta, cuenta.service_account_email)
+            print(f"Conectado exitosamente como: {cuenta.service_account_email}")
         
-        print(f"Conectado exitosamente como: {creds.service_account_email}")
-        print("Iniciando escaneo profundo... esto puede tardar unos minutos.")
+        # Construcción del servicio con credenciales explícitas (uno por hilo del escaneo)
+        def crear_servicio():
+            return construir_servicio(creds)
         
         inicio_tiempo = time.time()
-        mapa_completo = obtener_estructura_drive(service, ID_CARPETA_MAESTRA)
+        estado = cargar_estado() if incremental else None
+        mapa_completo = None
+        if estado and estado.get('raiz') == ID_CARPETA_MAESTRA and os.path.exists("master_songs.json"):
+            print("Aplicando cambios desde la última publicación...")
+            with open("master_songs.json", "r", encoding="utf-8") as f:
+                anterior = json.load(f).get("archivos", [])
+            try:
+                mapa_completo, aplicados = aplicar_cambios(crear_servicio, anterior, estado)
+                print(f" -> Cambios aplicados: {aplicados}")
+            except HttpError as error:
+                print(f" [!] No se pudo leer el feed de cambios ({error}). Se hará un escaneo completo.")
+        elif incremental:
+            print("No hay estado previo: se hará un escaneo completo.")
+
+        if mapa_completo is None:
+            print("Iniciando escaneo profundo... esto puede tardar unos minutos.")
+            mapa_completo, estado = escaneo_completo(crear_servicio)
         fin_tiempo = time.time()
         
         # Estructura final del JSON
@@ -100,12 +334,19 @@ def ejecutar():
         # Guardar en disco
         with open("master_songs.json", "w", encoding="utf-8") as f:
             json.dump(data_final, f, indent=4, ensure_ascii=False)
+
+        # Formato binario comprimido (el launcher lo prefiere si está publicado)
+        generar_binario(data_final)
+
+        # El estado se guarda al final: si algo falla, la próxima vez se reaplican los mismos cambios
+        guardar_estado(estado)
         
         print("\n" + "="*50)
         print("¡MAPEO FINALIZADO CON ÉXITO!")
         print(f"Archivos encontrados: {len(mapa_completo)}")
         print(f"Tiempo total: {round(fin_tiempo - inicio_tiempo, 2)} segundos")
         print("Archivo generado: master_songs.json")
+        print(f"Archivo generado: {manifest_bin.NOMBRE_COMPRIMIDO} (súbelo junto al JSON)")
         print("="*50)
         
     except Exception as e:
@@ -113,4 +354,7 @@ def ejecutar():
         print("Verifica que hayas compartido la carpeta de Drive con el correo de la Service Account.")
 
 if __name__ == '__main__':
-    ejecutar()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Genera master_songs.json desde la carpeta maestra de Drive.")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"Aplica solo los cambios desde la última ejecución (usa {ESTADO_MANIFIESTO}).")
+    ejecutar(incremental=parser.parse_args().incremental)